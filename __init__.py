@@ -23,6 +23,8 @@ Modules:
 
 - nodes.py: Docutils document tree (doctree) node class library.
 
+- serial.py: Compact binary serialization of document trees.
+
 - statemachine.py: A finite state machine specialized for
   regular-expression-based text filters.
 
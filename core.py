@@ -14,10 +14,16 @@ custom component objects first, and pass *them* to
 
 __docformat__ = 'reStructuredText'
 
+import os
 import sys
+import copy
 import pprint
+import itertools
+import traceback
+import cPickle as pickle
+from StringIO import StringIO
 from docutils import __version__, __version_details__, SettingsSpec
-from docutils import frontend, io, utils, readers, writers
+from docutils import frontend, io, utils, readers, writers, statemachine
 from docutils.frontend import OptionParser
 from docutils.transforms import Transformer
 import docutils.readers.doctree
@@ -28,6 +34,16 @@ try:
 except:
     argv_encoding = 'ascii'
 
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    from hashlib import sha1
+except ImportError:                     # Python < 2.5
+    from sha import new as sha1
+
 
 class Publisher:
 
@@ -35,6 +51,9 @@ class Publisher:
     A facade encapsulating the high-level logic of a Docutils system.
     """
 
+    option_parser_class = OptionParser
+    """The `docutils.frontend.OptionParser` (sub)class to use."""
+
     def __init__(self, reader=None, parser=None, writer=None,
                  source=None, source_class=io.FileInput,
                  destination=None, destination_class=io.FileOutput,
@@ -113,7 +132,7 @@ class Publisher:
             if len(parts) > 1 and parts[-1] == 'application':
                 settings_spec.config_section_dependencies = ['applications']
         #@@@ Add self.source & self.destination to components in future?
-        option_parser = OptionParser(
+        option_parser = self.option_parser_class(
             components=(self.parser, self.reader, self.writer, settings_spec),
             defaults=defaults, read_config_files=1,
             usage=usage, description=description)
@@ -183,6 +202,150 @@ class Publisher:
             destination=destination, destination_path=destination_path,
             encoding=self.settings.output_encoding,
             error_handler=self.settings.output_encoding_error_handler)
+        if isinstance(self.destination, io.FileOutput):
+            settings = self.settings
+            destination = self.destination
+            destination.atomic = getattr(settings, 'atomic_output', 0)
+            destination.only_if_changed = getattr(
+                settings, 'skip_unchanged_output', 0)
+            destination.fsync = getattr(settings, 'fsync_output', 0)
+            destination.buffer_size = getattr(
+                settings, 'output_buffer_size', destination.buffer_size)
+
+    def read_document(self):
+        """
+        Read and return the document tree from `self.source`.
+
+        If the "doctree_cache" setting names a directory, the parsed
+        document tree is stored there, and read back instead of parsing
+        the source again as long as the source text, the files recorded as
+        dependencies, the settings, and the Docutils version are the same.
+        All settings count (writer settings included), so different writers
+        do not share cache entries.
+        """
+        directory = getattr(self.settings, 'doctree_cache', None)
+        if not directory or getattr(self.settings, 'profile_parse', None):
+            # Profiling needs an actual parse.
+            return self.reader.read(self.source, self.parser, self.settings)
+        text = self.source.read()
+        if not isinstance(text, unicode):   # e.g. `io.DocTreeInput`
+            return self.reader.read(self.source, self.parser, self.settings)
+        source_path = self.source.source_path
+        path = os.path.join(
+            directory, doctree_cache_key(text, source_path, self.settings))
+        document = self.load_cached_document(path)
+        if document is not None:
+            return document
+        source = io.StringInput(source=text, source_path=source_path,
+                                encoding='unicode')
+        dependencies = self.settings.record_dependencies
+        self.settings.record_dependencies = utils.DependencyList()
+        try:
+            document = self.reader.read(source, self.parser, self.settings)
+            recorded = self.settings.record_dependencies.list
+        finally:
+            self.settings.record_dependencies = dependencies
+        if dependencies is not None:
+            dependencies.add(*recorded)
+        self.store_cached_document(path, document, recorded)
+        return document
+
+    def load_cached_document(self, path):
+        """
+        Return the document tree stored in the doctree cache file `path`,
+        or None if there is none or it is out of date.
+        """
+        try:
+            cache_file = open(path, 'rb')
+            try:
+                (version, dependencies, transforms, serialno, locator,
+                 document) = pickle.load(cache_file)
+            finally:
+                cache_file.close()
+        except Exception:               # missing, corrupt, or incompatible
+            return None
+        if version != __version__:
+            return None
+        for dependency, digest in dependencies:
+            try:
+                if file_digest(dependency) != digest:
+                    return None
+            except IOError:
+                return None
+        document.settings = self.settings
+        document.reporter = utils.new_reporter(
+            utils.decode_path(self.source.source_path), self.settings)
+        if locator is not None:
+            document.reporter.locator = locator.get_source_and_line
+        document.transformer = Transformer(document)
+        document.transformer.transforms = transforms
+        document.transformer.serialno = serialno
+        self.report_cached_messages(document)
+        if self.settings.record_dependencies is not None:
+            self.settings.record_dependencies.add(
+                *[dependency for dependency, digest in dependencies])
+        return document
+
+    def store_cached_document(self, path, document, dependencies):
+        """Store `document` in the doctree cache file `path`."""
+        try:
+            dependencies = [(dependency, file_digest(dependency))
+                            for dependency in dependencies]
+        except IOError:
+            return
+        # The source and line lookup for messages of later transforms:
+        locator = getattr(getattr(document.reporter, 'locator', None),
+                          'im_self', None)
+        if not isinstance(locator, statemachine.LineLocator):
+            locator = None
+        settings = document.settings
+        document.settings = None
+        try:
+            try:
+                data = pickle.dumps(
+                    (__version__, dependencies,
+                     document.transformer.transforms,
+                     document.transformer.serialno, locator, document),
+                    pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                return                  # e.g. unpicklable pending details
+        finally:
+            document.settings = settings
+        # Write to a temporary file first, so that concurrent readers
+        # never see a partial entry.
+        temp_path = '%s.%s.tmp' % (path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            cache_file = open(temp_path, 'wb')
+            try:
+                cache_file.write(data)
+            finally:
+                cache_file.close()
+            if os.path.exists(path):    # os.rename fails on Windows
+                os.remove(path)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            pass
+
+    def report_cached_messages(self, document):
+        """
+        Report the system messages of a document read from the doctree
+        cache, as if they were generated by parsing.
+        """
+        reporter = document.reporter
+        for msg in document.parse_messages:
+            level = msg['level']
+            if reporter.stream and (level >= reporter.report_level
+                                    or reporter.debug_flag
+                                    and level == reporter.DEBUG_LEVEL):
+                msgtext = msg.astext() + '\n'
+                try:
+                    reporter.stream.write(msgtext)
+                except UnicodeEncodeError:
+                    reporter.stream.write(msgtext.encode(
+                        reporter.encoding, reporter.error_handler))
+            reporter.max_level = max(level, reporter.max_level)
 
     def apply_transforms(self):
         self.document.transformer.populate_from_components(
@@ -205,8 +368,7 @@ class Publisher:
                     argv, usage, description, settings_spec, config_section,
                     **(settings_overrides or {}))
             self.set_io()
-            self.document = self.reader.read(self.source, self.parser,
-                                             self.settings)
+            self.document = self.read_document()
             self.apply_transforms()
             output = self.writer.write(self.document, self.destination)
             self.writer.assemble_parts()
@@ -249,10 +411,20 @@ class Publisher:
                   pending and pending.details, kwargs)
                  for priority, xclass, pending, kwargs
                  in self.document.transformer.applied])
+        if self.settings.profile_transforms:
+            print >>sys.stderr, ('\n::: Transform profile (node count before '
+                                 'and change, resident memory change):')
+            self.document.transformer.report_statistics(sys.stderr)
         if self.settings.dump_pseudo_xml:
             print >>sys.stderr, '\n::: Pseudo-XML:'
             print >>sys.stderr, self.document.pformat().encode(
                 'raw_unicode_escape')
+        if self.settings.profile_parse:
+            profile = getattr(self.document, 'parse_profile', None)
+            if profile is not None:
+                print >>sys.stderr, ('\n::: Parse profile (seconds, most '
+                                     'internal time first):')
+                profile.report(sys.stderr)
 
     def report_Exception(self, error):
         if isinstance(error, utils.SystemMessage):
@@ -304,6 +476,40 @@ command line used.""" % (__version__, __version_details__,
                self.settings.output_encoding_error_handler,
                __version__, sys.version.split()[0]))
 
+doctree_cache_ignored_settings = (
+    'doctree_cache', 'record_dependencies', 'warning_stream', 'traceback',
+    'exit_status_level', 'output_encoding', 'output_encoding_error_handler',
+    'error_encoding', 'error_encoding_error_handler', 'dump_settings',
+    'dump_internals', 'dump_transforms', 'dump_pseudo_xml',
+    'profile_transforms', 'node_index', 'jobs',
+    'destination_dir', 'destination_suffix', 'atomic_output',
+    'skip_unchanged_output', 'fsync_output', 'output_buffer_size',
+    'url_timeout', 'url_cache', 'url_prefetch')
+"""Settings without influence on the parsed document tree."""
+
+def doctree_cache_key(text, source_path, settings):
+    """
+    Return the doctree cache file name for the source `text` read from
+    `source_path`, parsed with `settings`.
+    """
+    items = [(name, value) for name, value in settings.__dict__.items()
+             if not name.startswith('_')
+             and name not in doctree_cache_ignored_settings]
+    items.sort()
+    key = sha1(__version__)
+    key.update(repr(source_path))
+    key.update(pprint.pformat(items))
+    key.update(text.encode('utf-8'))
+    return key.hexdigest() + '.doctree'
+
+def file_digest(path):
+    """Return the SHA-1 hex digest of the contents of file `path`."""
+    data_file = open(path, 'rb')
+    try:
+        return sha1(data_file.read()).hexdigest()
+    finally:
+        data_file.close()
+
 default_usage = '%prog [options] [<source> [<destination>]]'
 default_description = ('Reads from <source> (default is stdin) and writes to '
                        '<destination> (default is stdout).  See '
@@ -488,7 +694,7 @@ def publish_from_doctree(document, destination_path=None,
             ..., settings_overrides={'output_encoding': 'unicode'})
 
     Parameters: `document` is a `docutils.nodes.document` object, an existing
-    document tree.
+    document tree, or a document tree serialized by `docutils.serial`.
 
     Other parameters: see `publish_programmatically`.
     """
@@ -646,3 +852,189 @@ def publish_programmatically(source_class, source, source_path,
     pub.set_destination(destination, destination_path)
     output = pub.publish(enable_exit_status=enable_exit_status)
     return output, pub
+
+
+class BatchOptionParser(OptionParser):
+
+    """
+    Command-line option parser for batch publishing: takes any number of
+    positional <source> arguments, stored in the ``_sources`` setting.
+    """
+
+    def check_values(self, values, args):
+        values._sources = args
+        return OptionParser.check_values(self, values, [])
+
+
+class BatchSettingsSpec(SettingsSpec):
+
+    """Runtime settings for `publish_batch_cmdline`."""
+
+    settings_spec = (
+        'Batch Publishing Options',
+        None,
+        (('Number of worker processes.  Default (or 0) is the number of '
+          'CPUs; 1 publishes serially, in-process.',
+          ['--jobs', '-j'],
+          {'metavar': '<n>', 'type': 'int',
+           'validator': frontend.validate_nonnegative_int}),
+         ('Write output files to <directory>.  Default is the directory '
+          'of each source file.',
+          ['--destination-dir'],
+          {'metavar': '<directory>'}),
+         ('Replace the source file extension with <suffix> to name output '
+          'files.  Default is "." followed by the writer name.',
+          ['--destination-suffix'],
+          {'metavar': '<suffix>'}),))
+
+    relative_path_settings = ('destination_dir',)
+
+
+batch_usage = '%prog [options] <source> [<source> ...]'
+batch_description = ('Reads each <source> and writes the output to a file '
+                     'of the same name with a new extension, in parallel.  '
+                     'See <http://docutils.sf.net/docs/user/config.html> for '
+                     'the full reference.')
+
+def publish_batch_cmdline(reader=None, reader_name='standalone',
+                          parser=None, parser_name='restructuredtext',
+                          writer=None, writer_name='pseudoxml',
+                          settings=None, settings_spec=None,
+                          settings_overrides=None, config_section=None,
+                          enable_exit_status=1, argv=None,
+                          usage=batch_usage, description=batch_description):
+    """
+    Set up & run `publish_batch` for the source paths given on the command
+    line.  System messages are written to ``sys.stderr`` per document, in
+    completion order.  Return the list of results.
+
+    Parameters: see `publish_cmdline`.  `reader`, `parser`, and `writer`
+    are only used to process the command line; the worker processes
+    instantiate components by name.  `settings_spec` defaults to a
+    `BatchSettingsSpec` instance.
+    """
+    if settings_spec is None:
+        settings_spec = BatchSettingsSpec()
+    pub = Publisher(reader, parser, writer, settings=settings)
+    pub.option_parser_class = BatchOptionParser
+    pub.set_components(reader_name, parser_name, writer_name)
+    if pub.settings is None:
+        pub.process_command_line(
+            argv, usage, description, settings_spec, config_section,
+            **(settings_overrides or {}))
+    settings = pub.settings
+    results = []
+    exit_status = 0
+    for result in publish_batch(
+        settings._sources, reader_name=reader_name, parser_name=parser_name,
+        writer_name=writer_name, settings=settings,
+        processes=getattr(settings, 'jobs', None)):
+        source_path, destination_path, status, messages, dependencies = result
+        sys.stderr.write(messages)
+        exit_status = max(exit_status, status)
+        results.append(result)
+    if enable_exit_status and exit_status:
+        sys.exit(exit_status)
+    return results
+
+def publish_batch(source_paths, destination_paths=None,
+                  reader_name='standalone', parser_name='restructuredtext',
+                  writer_name='pseudoxml', settings=None, settings_spec=None,
+                  settings_overrides=None, config_section=None,
+                  processes=None):
+    """
+    Publish several files in a pool of worker processes.  Generate a
+    ``(source_path, destination_path, exit_status, messages, dependencies)``
+    tuple per document, in completion order.
+
+    Settings are processed once and shared by the workers; each worker
+    runs a single `Publisher`.  `messages` is the text written to
+    ``sys.stderr`` (system messages, error reports); `dependencies` is the
+    list of files the document depends on, also added to the
+    "record_dependencies" setting.  `exit_status` is 0, or as for
+    `publish_cmdline` with `enable_exit_status` set.
+
+    Parameters: see `publish_programmatically` for the remainder.
+
+    - `source_paths`: List of input file paths.
+    - `destination_paths`: List of output file paths.  Default: the source
+      paths, with the extension replaced by the "destination_suffix"
+      setting (default "." + `writer_name`) and moved to the
+      "destination_dir" setting directory, if set.
+    - `processes`: Number of worker processes; default (or 0) is the
+      number of CPUs.  With 1, or without the `multiprocessing` module,
+      documents are published serially in the calling process.
+    """
+    pub = Publisher(settings=settings)
+    pub.set_components(reader_name, parser_name, writer_name)
+    pub.process_programmatic_settings(
+        settings_spec, settings_overrides, config_section)
+    settings = pub.settings
+    if destination_paths is None:
+        destination_paths = [batch_destination_path(path, settings,
+                                                     writer_name)
+                             for path in source_paths]
+    tasks = zip(source_paths, destination_paths)
+    shared_settings = copy.copy(settings)
+    shared_settings.record_dependencies = None
+    initargs = (reader_name, parser_name, writer_name, shared_settings)
+    if not processes and multiprocessing:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2 or not multiprocessing:
+        _init_batch_worker(*initargs)
+        results = itertools.imap(_publish_batch_item, tasks)
+    else:
+        pool = multiprocessing.Pool(processes, _init_batch_worker, initargs)
+        results = pool.imap_unordered(_publish_batch_item, tasks, 1)
+        pool.close()
+    for result in results:
+        if settings.record_dependencies:
+            settings.record_dependencies.add(*result[4])
+        yield result
+
+def batch_destination_path(source_path, settings, writer_name):
+    """Return the default output file path for `publish_batch`."""
+    suffix = (getattr(settings, 'destination_suffix', None)
+              or '.' + writer_name)
+    path = os.path.splitext(source_path)[0] + suffix
+    directory = getattr(settings, 'destination_dir', None)
+    if directory:
+        path = os.path.join(directory, os.path.basename(path))
+    return path
+
+_batch_worker = None
+"""The worker process' (`Publisher`, settings) pair."""
+
+def _init_batch_worker(reader_name, parser_name, writer_name, settings):
+    global _batch_worker
+    pub = Publisher()
+    pub.set_components(reader_name, parser_name, writer_name)
+    _batch_worker = (pub, settings)
+
+def _publish_batch_item(paths):
+    source_path, destination_path = paths
+    pub, settings = _batch_worker
+    pub.settings = copy.copy(settings)
+    pub.settings.record_dependencies = utils.DependencyList()
+    if pub.settings.warning_stream:
+        pub.settings.warning_stream = None  # shared file; use sys.stderr
+    pub.source = pub.destination = pub.document = None
+    stream = StringIO()
+    stderr = sys.stderr
+    sys.stderr = stream
+    try:
+        try:
+            pub.set_source(None, source_path)
+            pub.set_destination(None, destination_path)
+            pub.publish(enable_exit_status=1)
+            exit_status = 0
+        except SystemExit, error:
+            exit_status = error.code
+        except Exception:
+            # propagated by the "traceback" setting
+            traceback.print_exc()
+            exit_status = 1
+    finally:
+        sys.stderr = stderr
+    return (source_path, destination_path, exit_status, stream.getvalue(),
+            pub.settings.record_dependencies.list)
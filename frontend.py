@@ -130,6 +130,13 @@ def validate_nonnegative_int(setting, value, option_parser,
         raise ValueError('negative value; must be positive or zero')
     return value
 
+def validate_nonnegative_float(setting, value, option_parser,
+                               config_parser=None, config_section=None):
+    value = float(value)
+    if value < 0:
+        raise ValueError('negative value; must be positive or zero')
+    return value
+
 def validate_threshold(setting, value, option_parser,
                        config_parser=None, config_section=None):
     try:
@@ -452,6 +459,22 @@ class OptionParser(optparse.OptionParser, docutils.SettingsSpec):
           '"xmlcharrefreplace", "backslashreplace".',
           ['--output-encoding-error-handler'],
           {'default': 'strict', 'validator': validate_encoding_error_handler}),
+         ('Write output files under a temporary name first, and rename '
+          'them when complete.',
+          ['--atomic-output'], {'action': 'store_true',
+                                'validator': validate_boolean}),
+         ('Leave output files untouched if their contents did not change.  '
+          'Implies --atomic-output.',
+          ['--skip-unchanged-output'], {'action': 'store_true',
+                                        'validator': validate_boolean}),
+         ('Flush output files to disk (fsync) before closing them.',
+          ['--fsync-output'], {'action': 'store_true',
+                               'validator': validate_boolean}),
+         ('Write output in blocks of at least <bytes> bytes.  '
+          'Default: 65536.',
+          ['--output-buffer-size'],
+          {'metavar': '<bytes>', 'default': 1 << 16,
+           'validator': validate_nonnegative_int}),
          ('Specify text encoding and error handler for error output.  '
           'Default: %s:%s.'
           % (default_error_encoding, default_error_encoding_error_handler),
@@ -471,6 +494,16 @@ class OptionParser(optparse.OptionParser, docutils.SettingsSpec):
           ['--record-dependencies'],
           {'metavar': '<file>', 'validator': validate_dependency_file,
            'default': None}),           # default set in Values class
+         ('Cache parsed document trees in <directory>.  Sources that did '
+          'not change (including included files) are not parsed again.',
+          ['--doctree-cache'], {'metavar': '<directory>'}),
+         ('Keep an index of the document tree by node class, to speed up '
+          'transforms on large documents.',
+          ['--node-index'], {'action': 'store_true',
+                             'validator': validate_boolean}),
+         ('Do not keep a node class index.  (default)',
+          ['--no-node-index'], {'dest': 'node_index',
+                                'action': 'store_false'}),
          ('Read configuration settings from <file>, if it exists.',
           ['--config'], {'metavar': '<file>', 'type': 'string',
                          'action': 'callback', 'callback': read_config_file}),
@@ -486,6 +519,8 @@ class OptionParser(optparse.OptionParser, docutils.SettingsSpec):
          (SUPPRESS_HELP, ['--dump-internals'], {'action': 'store_true'}),
          (SUPPRESS_HELP, ['--dump-transforms'], {'action': 'store_true'}),
          (SUPPRESS_HELP, ['--dump-pseudo-xml'], {'action': 'store_true'}),
+         (SUPPRESS_HELP, ['--profile-parse'], {'action': 'store_true'}),
+         (SUPPRESS_HELP, ['--profile-transforms'], {'action': 'store_true'}),
          (SUPPRESS_HELP, ['--expose-internal-attribute'],
           {'action': 'append', 'dest': 'expose_internals',
            'validator': validate_colon_separated_string_list}),
@@ -501,7 +536,7 @@ class OptionParser(optparse.OptionParser, docutils.SettingsSpec):
                          '_config_files': None}
     """Defaults for settings that don't have command-line option equivalents."""
 
-    relative_path_settings = ('warning_stream',)
+    relative_path_settings = ('warning_stream', 'doctree_cache')
 
     config_section = 'general'
 
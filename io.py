@@ -10,12 +10,31 @@ will exist for a variety of input/output mechanisms.
 __docformat__ = 'reStructuredText'
 
 import sys
+import os
 try:
     import locale
 except:
     pass
+try:
+    import mmap
+except ImportError:
+    mmap = None
 import re
 import codecs
+import filecmp
+import tempfile
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
 from docutils import TransformSpec
 from docutils._compat import b
 
@@ -134,13 +153,23 @@ class Input(TransformSpec):
         """
         Try to determine the encoding of `data` by looking *in* `data`.
         Check for a byte order mark (BOM) or an encoding declaration.
+
+        Only the start of `data` (a string or a memory-mapped file) is
+        examined.
         """
         # check for a byte order mark:
         for start_bytes, encoding in self.byte_order_marks:
-            if data.startswith(start_bytes):
+            if data[:len(start_bytes)] == start_bytes:
                 return encoding
         # check for an encoding declaration pattern in first 2 lines of file:
-        for line in data.splitlines()[:2]:
+        size = 1024
+        while 1:
+            head = data[:size]
+            lines = head.splitlines()
+            if len(lines) > 2 or len(head) < size:
+                break
+            size *= 8
+        for line in lines[:2]:
             match = self.coding_slug.search(line)
             if match:
                 return match.group(1).decode('ascii')
@@ -201,6 +230,11 @@ class FileInput(Input):
     Input for single, simple file-like objects.
     """
 
+    mmap_threshold = 1 << 22
+    """Files opened by `FileInput` from `source_path` and at least this
+    large (in bytes) are memory-mapped & decoded in place, instead of being
+    read into a string first.  0 disables memory-mapping."""
+
     def __init__(self, source=None, source_path=None,
                  encoding=None, error_handler='strict',
                  autoclose=1, handle_io_errors=1, mode='rU'):
@@ -216,22 +250,30 @@ class FileInput(Input):
             - `handle_io_errors`: summarize I/O errors here, and exit?
             - `mode`: how the file is to be opened (see standard function
               `open`). The default 'rU' provides universal newline support
-              for text files.
+              for text files (in Python 2, the file is opened in binary
+              mode and newlines are translated after decoding, so that
+              multi-byte encodings like UTF-16 are handled correctly).
         """
         Input.__init__(self, source, source_path, encoding, error_handler)
         self.autoclose = autoclose
         self.handle_io_errors = handle_io_errors
+        self.mode = None
+        """The mode `source_path` was opened with (None if `source` given)."""
         if source is None:
             if source_path:
                 # Specify encoding in Python 3
                 if sys.version_info >= (3,0):
                     kwargs = {'encoding': self.encoding,
                               'errors': self.error_handler}
+                    open_mode = mode
                 else:
                     kwargs = {}
+                    # Translate newlines in `read()`, after decoding:
+                    open_mode = mode.replace('U', 'b')
 
                 try:
-                    self.source = open(source_path, mode, **kwargs)
+                    self.source = open(source_path, open_mode, **kwargs)
+                    self.mode = mode
                 except IOError, error:
                     if not handle_io_errors:
                         raise
@@ -254,17 +296,57 @@ class FileInput(Input):
         """
         Read and decode a single file and return the data (Unicode string).
         """
+        mapped = None
         try:
-            data = self.source.read()
+            mapped = self.map_source()
+            if mapped is None:
+                data = self.decode(self.source.read())
+            else:
+                data = self.decode(mapped)
         finally:
+            if mapped is not None:
+                mapped.close()
             if self.autoclose:
                 self.close()
-        return self.decode(data)
+        if (self.mode and 'U' in self.mode and sys.version_info < (3,0)
+            and u'\r' in data):
+            # Universal newlines (the file was opened in binary mode):
+            data = data.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+        return data
+
+    def map_source(self):
+        """
+        Return a read-only memory map of a large source file opened by
+        `FileInput`, or None.
+
+        Decoding from the map avoids holding the undecoded file contents in
+        memory along with the decoded text; trying another encoding after a
+        failed attempt doesn't re-read the file.
+        """
+        if (mmap is None or not self.mode or not self.mmap_threshold
+            or sys.version_info >= (3,0)):
+            return None
+        if ('b' not in self.mode and 'U' not in self.mode
+            and os.linesep != '\n'):
+            return None                 # text mode newline translation
+        try:
+            fileno = self.source.fileno()
+            if os.fstat(fileno).st_size < self.mmap_threshold:
+                return None
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
 
     def readlines(self):
         """
         Return lines of a single file as list of Unicode strings.
         """
+        if self.mode and 'U' in self.mode and sys.version_info < (3,0):
+            # Split the decoded text, with newlines translated by `read()`:
+            lines = self.read().split(u'\n')
+            if lines[-1]:
+                return [line + u'\n' for line in lines[:-1]] + lines[-1:]
+            return [line + u'\n' for line in lines[:-1]]
         try:
             lines = self.source.readlines()
         finally:
@@ -280,8 +362,35 @@ class FileOutput(Output):
 
     """
     Output for single, simple file-like objects.
+
+    Files opened from `destination_path` may be written to a temporary file
+    in the same directory first (`atomic`, `only_if_changed`).  It replaces
+    the destination file when closed, or is removed if its contents are the
+    same as those of the destination file.  Symbolic links are followed
+    (the file they point to is replaced), and existing destinations which
+    are not regular files (e.g. devices or named pipes) are written to
+    directly.
     """
 
+    atomic = 0
+    """Write to a temporary file, renamed to `destination_path` when
+    complete?"""
+
+    only_if_changed = 0
+    """Leave the destination file untouched if its contents wouldn't
+    change?  (Implies writing to a temporary file.)"""
+
+    fsync = 0
+    """Flush the data to disk (`os.fsync()`) before closing?"""
+
+    buffer_size = 1 << 16
+    """Minimum size (in bytes) of the blocks written by `write_chunks()`."""
+
+    mode = 'w'
+    """Mode for opening `destination_path`.  (Do not use binary mode ('wb')
+    for text as this prevents the conversion of newlines to the system
+    specific default.)"""
+
     def __init__(self, destination=None, destination_path=None,
                  encoding=None, error_handler='strict', autoclose=1,
                  handle_io_errors=1):
@@ -300,6 +409,14 @@ class FileOutput(Output):
         self.opened = 1
         self.autoclose = autoclose
         self.handle_io_errors = handle_io_errors
+        self.temp_path = None
+        """Path of the temporary file written instead of `destination_path`."""
+        self.real_path = None
+        """`destination_path` with symbolic links resolved, replaced by the
+        temporary file."""
+        self.unchanged = None
+        """True if the destination file was left untouched because the
+        output was the same."""
         if destination is None:
             if destination_path:
                 self.opened = None
@@ -314,17 +431,28 @@ class FileOutput(Output):
 
     def open(self):
         # Specify encoding in Python 3.
-        # (Do not use binary mode ('wb') as this prevents the
-        # conversion of newlines to the system specific default.)
-        if sys.version_info >= (3,0):
+        if sys.version_info >= (3,0) and 'b' not in self.mode:
             kwargs = {'encoding': self.encoding,
                       'errors': self.error_handler}
         else:
             kwargs = {}
 
         try:
-            self.destination = open(self.destination_path, 'w', **kwargs)
-        except IOError, error:
+            path = None
+            if self.atomic or self.only_if_changed:
+                path = os.path.realpath(self.destination_path)
+                if os.path.exists(path) and not os.path.isfile(path):
+                    path = None     # e.g. a device: can't be replaced
+            if path:
+                self.real_path = path
+                directory, name = os.path.split(path)
+                fd, self.temp_path = tempfile.mkstemp(
+                    prefix='.%s.' % name, suffix='.tmp', dir=directory)
+                self.destination = os.fdopen(fd, self.mode, **kwargs)
+            else:
+                self.destination = open(self.destination_path, self.mode,
+                                        **kwargs)
+        except EnvironmentError, error:
             if not self.handle_io_errors:
                 raise
             print >>sys.stderr, '%s: %s' % (error.__class__.__name__,
@@ -345,34 +473,108 @@ class FileOutput(Output):
             output = self.encode(data)
         if not self.opened:
             self.open()
+        complete = None
         try:
             self.destination.write(output)
+            complete = 1
         finally:
             if self.autoclose:
-                self.close()
+                self.close(discard=not complete)
         return output
 
-    def close(self):
+    def write_chunks(self, chunks):
+        """
+        Encode the Unicode strings from the iterable `chunks` and write them
+        to a single file, one at a time.  Same as ``self.write(u''.join(
+        chunks))``, but without holding the whole output in memory; nothing
+        is returned.
+
+        Chunks are collected and written in blocks of at least
+        `self.buffer_size` bytes.
+        """
+        if (sys.version_info >= (3,0)
+            or self.encoding and self.encoding.lower() == 'unicode'):
+            encode = None
+        else:
+            encode = codecs.getincrementalencoder(self.encoding)(
+                self.error_handler).encode
+        if not self.opened:
+            self.open()
+        complete = None
+        try:
+            buffer = []
+            size = 0
+            for chunk in chunks:
+                if encode:
+                    chunk = encode(chunk)
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= self.buffer_size:
+                    self.destination.write(''.join(buffer))
+                    buffer = []
+                    size = 0
+            if encode:
+                buffer.append(encode(u'', 1))
+            if buffer:
+                self.destination.write(''.join(buffer))
+            complete = 1
+        finally:
+            if self.autoclose:
+                self.close(discard=not complete)
+
+    def close(self, discard=0):
+        """
+        Close the destination.  Move a temporary file into place, unless
+        `discard` is true (in which case it is removed).
+        """
+        if self.fsync:
+            try:
+                self.destination.flush()
+                os.fsync(self.destination.fileno())
+            except (AttributeError, EnvironmentError):
+                pass
         self.destination.close()
         self.opened = None
+        if self.temp_path:
+            temp_path = self.temp_path
+            self.temp_path = None
+            if discard:
+                os.remove(temp_path)
+            else:
+                self.replace_destination(temp_path)
+
+    def replace_destination(self, temp_path):
+        """Replace the destination file by the file `temp_path`."""
+        path = self.real_path
+        exists = os.path.exists(path)
+        if (self.only_if_changed and exists
+            and filecmp.cmp(temp_path, path, shallow=0)):
+            os.remove(temp_path)
+            self.unchanged = 1
+            return
+        self.unchanged = 0
+        # `tempfile.mkstemp()` creates files readable by the owner only:
+        if exists:
+            mode = os.stat(path).st_mode & 07777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0666 & ~umask
+        os.chmod(temp_path, mode)
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # Windows won't rename onto an existing file:
+            os.remove(path)
+            os.rename(temp_path, path)
 
 
 class BinaryFileOutput(FileOutput):
     """
     A version of docutils.io.FileOutput which writes to a binary file.
     """
-    def open(self):
-        try:
-            self.destination = open(self.destination_path, 'wb')
-        except IOError, error:
-            if not self.handle_io_errors:
-                raise
-            print >>sys.stderr, '%s: %s' % (error.__class__.__name__,
-                                            error)
-            print >>sys.stderr, ('Unable to open destination file for writing '
-                                 "('%s').  Exiting." % self.destination_path)
-            sys.exit(1)
-        self.opened = 1
+
+    mode = 'wb'
 
 
 class StringInput(Input):
@@ -433,11 +635,259 @@ class DocTreeInput(Input):
     """
     Adapter for document tree input.
 
-    The document tree must be passed in the ``source`` parameter.
+    The document tree must be passed in the ``source`` parameter, either as
+    a `docutils.nodes.document` object or serialized by `docutils.serial`
+    (a byte string or a binary file object).  With no ``source``, the
+    serialized document tree is read from the file ``source_path``.
     """
 
     default_source_path = 'doctree input'
 
     def read(self):
         """Return the document tree."""
-        return self.source
+        source = self.source
+        if source is None and self.source_path != self.default_source_path:
+            source_file = open(self.source_path, 'rb')
+            try:
+                source = source_file.read()
+            finally:
+                source_file.close()
+        elif hasattr(source, 'read'):
+            source = source.read()
+        if isinstance(source, str):
+            from docutils import serial
+            return serial.loads(source)
+        return source
+
+
+class URLFetcher:
+
+    """
+    Fetch the data of URLs for directives like "raw" and "csv-table".
+
+    Fetched data is kept in memory for the life of the process (least
+    recently used entries are dropped beyond `max_entries`) and, if a
+    `cache_dir` is passed, on disk.  Data stored on disk is revalidated
+    with the server ("ETag" & "Last-Modified" headers), so it is only
+    transferred again if it changed.  `prefetch()` fetches a number of
+    URLs concurrently.
+
+    The socket `timeout` (in seconds; None: no timeout, Python 2.6 and
+    later) and the `cache_dir` (None: no disk cache) are arguments of
+    each call, so that documents with different settings can share the
+    fetcher.
+    """
+
+    max_entries = 32
+    """Maximum number of URLs whose data is kept in memory (0: none)."""
+
+    max_workers = 8
+    """Maximum number of concurrent requests in `prefetch()`."""
+
+    def __init__(self):
+        self.entries = {}
+        """Mapping of {url: [last use, data]}."""
+
+        self.clock = 0
+        """Incremented on every lookup; orders the entries by last use."""
+
+        self.hits = 0
+        """Number of lookups answered from memory."""
+
+        self.misses = 0
+        """Number of lookups that required a request."""
+
+        self.failures = {}
+        """Mapping of {url: exception} for failed prefetches, raised again
+        by the next `fetch()` of the URL instead of retrying."""
+
+        self.lock = threading.Lock()
+
+    def fetch(self, url, timeout=None, cache_dir=None):
+        """
+        Return the data of `url` (a byte string).
+
+        Raise `urllib2.URLError`, `IOError`, `OSError` or `ValueError` if
+        it can't be fetched.
+        """
+        self.lock.acquire()
+        try:
+            self.clock += 1
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.hits += 1
+                entry[0] = self.clock
+                return entry[1]
+            self.misses += 1
+            error = self.failures.pop(url, None)
+        finally:
+            self.lock.release()
+        if error is not None:
+            raise error
+        data = self.download(url, timeout, cache_dir)
+        self.remember(url, data)
+        return data
+
+    def prefetch(self, urls, timeout=None, cache_dir=None):
+        """
+        Fetch `urls` concurrently, in preparation for their `fetch()`.
+
+        Failures are not reported here but by the `fetch()` of the URL.
+        """
+        pending = []
+        for url in urls:
+            if url not in self.entries and url not in pending:
+                pending.append(url)
+        pending = pending[:self.max_entries]
+        pending.reverse()               # workers pop from the end
+        workers = [threading.Thread(target=self.prefetch_worker,
+                                    args=(pending, timeout, cache_dir))
+                   for i in range(min(len(pending), self.max_workers))]
+        for worker in workers:
+            worker.setDaemon(1)
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def prefetch_worker(self, pending, timeout, cache_dir):
+        """Fetch the URLs popped from the shared list `pending`."""
+        while 1:
+            self.lock.acquire()
+            try:
+                if not pending:
+                    return
+                url = pending.pop()
+            finally:
+                self.lock.release()
+            try:
+                data = self.download(url, timeout, cache_dir)
+            except Exception, error:
+                self.lock.acquire()
+                try:
+                    self.failures[url] = error
+                finally:
+                    self.lock.release()
+            else:
+                self.remember(url, data)
+
+    def remember(self, url, data):
+        """Keep `data` for `url` in memory, dropping the least recently used."""
+        if self.max_entries <= 0:
+            return
+        self.lock.acquire()
+        try:
+            self.clock += 1
+            self.entries[url] = [self.clock, data]
+            if len(self.entries) > self.max_entries:
+                by_use = [(entry[0], entry_url)
+                          for entry_url, entry in self.entries.items()]
+                by_use.sort()
+                for last_use, entry_url in by_use[:-self.max_entries]:
+                    del self.entries[entry_url]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """Drop all data kept in memory (the counters are kept)."""
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.failures.clear()
+        finally:
+            self.lock.release()
+
+    def download(self, url, timeout=None, cache_dir=None):
+        """
+        Request the data of `url`, revalidating the copy in the disk cache
+        if there is one.
+        """
+        # Do not import urllib2 at the top of the module because
+        # it may fail due to broken SSL dependencies, and it takes
+        # about 0.15 seconds to load.
+        import urllib2
+        request = urllib2.Request(url)
+        path = self.cache_path(url, cache_dir)
+        stored = None
+        if path:
+            stored = self.load(path, url)
+        if stored is not None:
+            etag, last_modified, data = stored
+            if etag:
+                request.add_header('If-None-Match', etag)
+            if last_modified:
+                request.add_header('If-Modified-Since', last_modified)
+        try:
+            if timeout is not None and sys.version_info >= (2, 6):
+                response = urllib2.urlopen(request, timeout=timeout)
+            else:
+                response = urllib2.urlopen(request)
+        except urllib2.HTTPError, error:
+            if stored is not None and error.code == 304:    # Not Modified
+                return data
+            raise
+        try:
+            data = response.read()
+            headers = response.info()
+            etag = headers.get('ETag')
+            last_modified = headers.get('Last-Modified')
+        finally:
+            response.close()
+        if path and (etag or last_modified):
+            self.store(path, url, etag, last_modified, data)
+        return data
+
+    def cache_path(self, url, cache_dir):
+        """
+        Return the file name for `url` in the disk cache `cache_dir`, or
+        None.
+        """
+        if (not cache_dir or
+            url.split(':', 1)[0].lower() not in ('http', 'https')):
+            return None
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return os.path.join(cache_dir, sha1(url).hexdigest() + '.url')
+
+    def load(self, path, url):
+        """
+        Return (ETag, Last-Modified, data) for `url` from the disk cache
+        file `path`, or None.
+        """
+        try:
+            cache_file = open(path, 'rb')
+            try:
+                stored_url, etag, last_modified, data = pickle.load(
+                    cache_file)
+            finally:
+                cache_file.close()
+        except Exception:               # missing, corrupt, or incompatible
+            return None
+        if stored_url != url:
+            return None
+        return etag, last_modified, data
+
+    def store(self, path, url, etag, last_modified, data):
+        """Store the data of `url` in the disk cache file `path`."""
+        # Write to a temporary file first, so that concurrent readers
+        # never see a partial entry.
+        temp_path = '%s.%s.%s.tmp' % (path, os.getpid(),
+                                      id(threading.currentThread()))
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            cache_file = open(temp_path, 'wb')
+            try:
+                pickle.dump((url, etag, last_modified, data), cache_file,
+                            pickle.HIGHEST_PROTOCOL)
+            finally:
+                cache_file.close()
+            if os.path.exists(path):    # os.rename fails on Windows
+                os.remove(path)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            pass
+
+
+url_fetcher = URLFetcher()
+"""Shared by all documents processed in this process."""
@@ -26,6 +26,7 @@ import os
 import re
 import warnings
 import types
+import inspect
 import unicodedata
 
 # ==============================
@@ -36,6 +37,8 @@ class Node(object):
 
     """Abstract base class of nodes in a document tree."""
 
+    __slots__ = ()
+
     parent = None
     """Back-reference to the Node immediately containing this Node."""
 
@@ -120,28 +123,44 @@ class Node(object):
 
         Return true if we should stop the traversal.
         """
-        stop = 0
-        visitor.document.reporter.debug(
-            'docutils.nodes.Node.walk calling dispatch_visit for %s'
-            % self.__class__.__name__)
-        try:
+        reporter = visitor.document.reporter
+        debug = reporter.debug_flag
+        dispatch_visit = visitor.dispatch_visit
+        # Iterative pre-order walk (no recursion limit on deep trees).
+        # `stack` holds iterators over copies of the children lists of the
+        # ancestors of `node`, taken after visiting them.
+        stack = []
+        node = self
+        while 1:
+            if debug:
+                reporter.debug(
+                    'docutils.nodes.Node.walk calling dispatch_visit for %s'
+                    % node.__class__.__name__)
+            descend = 1
             try:
-                visitor.dispatch_visit(self)
+                dispatch_visit(node)
             except (SkipChildren, SkipNode):
-                return stop
+                descend = 0
             except SkipDeparture:           # not applicable; ignore
                 pass
-            children = self.children
-            try:
-                for child in children[:]:
-                    if child.walk(visitor):
-                        stop = 1
-                        break
             except SkipSiblings:
-                pass
-        except StopTraversal:
-            stop = 1
-        return stop
+                if not stack:
+                    raise
+                stack.pop()
+                descend = 0
+            except StopTraversal:
+                return 1
+            if descend and node.children:
+                stack.append(iter(node.children[:]))
+            while stack:
+                for node in stack[-1]:
+                    break
+                else:
+                    stack.pop()
+                    continue
+                break
+            else:
+                return 0
 
     def walkabout(self, visitor):
         """
@@ -155,54 +174,121 @@ class Node(object):
 
         Return true if we should stop the traversal.
         """
-        call_depart = 1
-        stop = 0
-        visitor.document.reporter.debug(
-            'docutils.nodes.Node.walkabout calling dispatch_visit for %s'
-            % self.__class__.__name__)
-        try:
+        reporter = visitor.document.reporter
+        debug = reporter.debug_flag
+        dispatch_visit = visitor.dispatch_visit
+        dispatch_departure = visitor.dispatch_departure
+        # Iterative version of the recursive traversal.  `stack` holds a
+        # [children iterator, node, call_depart] frame per ancestor of
+        # `node`.  Exceptions escaping a node (`SkipSiblings` from a visit,
+        # `SkipSiblings`, `SkipChildren` & `StopTraversal` from a departure)
+        # are handled by the parent's frame as the recursion would: it stops
+        # iterating and is departed.
+        stack = []
+        node = self
+        while 1:
+            if debug:
+                reporter.debug(
+                    'docutils.nodes.Node.walkabout calling dispatch_visit '
+                    'for %s' % node.__class__.__name__)
+            call_depart = 1
+            stop = 0
+            children = None
             try:
-                visitor.dispatch_visit(self)
+                dispatch_visit(node)
+                children = node.children
             except SkipNode:
-                return stop
+                call_depart = 0
             except SkipDeparture:
                 call_depart = 0
-            children = self.children
-            try:
-                for child in children[:]:
-                    if child.walkabout(visitor):
-                        stop = 1
-                        break
-            except SkipSiblings:
+                children = node.children
+            except SkipChildren:
                 pass
-        except SkipChildren:
-            pass
-        except StopTraversal:
-            stop = 1
-        if call_depart:
-            visitor.document.reporter.debug(
-                'docutils.nodes.Node.walkabout calling dispatch_departure '
-                'for %s' % self.__class__.__name__)
-            visitor.dispatch_departure(self)
-        return stop
+            except StopTraversal:
+                stop = 1
+            except SkipSiblings:
+                if not stack:
+                    raise
+                stack[-1][0] = iter(())
+                call_depart = 0
+            if children:
+                stack.append([iter(children[:]), node, call_depart])
+            # Depart finished nodes, until there is a next node to visit:
+            while 1:
+                if not children and call_depart:
+                    if debug:
+                        reporter.debug(
+                            'docutils.nodes.Node.walkabout calling '
+                            'dispatch_departure for %s'
+                            % node.__class__.__name__)
+                    try:
+                        dispatch_departure(node)
+                    except (SkipSiblings, SkipChildren):
+                        if not stack:
+                            raise
+                        stack[-1][0] = iter(())
+                        stop = 0
+                    except StopTraversal:
+                        if not stack:
+                            raise
+                        stop = 1
+                if not stack:
+                    return stop
+                children = None
+                if stop:
+                    iterator, node, call_depart = stack.pop()
+                    continue
+                for node in stack[-1][0]:
+                    break
+                else:
+                    iterator, node, call_depart = stack.pop()
+                    continue
+                break
 
     def _fast_traverse(self, cls):
         """Specialized traverse() that only supports instance checks."""
         result = []
         if isinstance(self, cls):
             result.append(self)
-        for child in self.children:
-            result.extend(child._fast_traverse(cls))
+        # Iterative pre-order walk (no recursion limit on deep trees):
+        stack = [iter(self.children)]
+        while stack:
+            for node in stack[-1]:
+                if isinstance(node, cls):
+                    result.append(node)
+                if node.children:
+                    stack.append(iter(node.children))
+                    break
+            else:
+                stack.pop()
         return result
 
     def _all_traverse(self):
         """Specialized traverse() that doesn't check for a condition."""
-        result = []
-        result.append(self)
-        for child in self.children:
-            result.extend(child._all_traverse())
+        result = [self]
+        stack = [iter(self.children)]
+        while stack:
+            for node in stack[-1]:
+                result.append(node)
+                if node.children:
+                    stack.append(iter(node.children))
+                    break
+            else:
+                stack.pop()
         return result
 
+    def _iter_descendants(self):
+        """Generate all descendants in tree traversal order."""
+        stack = [iter(self.children)]
+        while stack:
+            for node in stack[-1]:
+                yield node
+                if node.children:
+                    stack.append(iter(node.children))
+                    break
+            else:
+                stack.pop()
+
     def traverse(self, condition=None,
                  include_self=1, descend=1, siblings=0, ascend=0):
         """
@@ -217,8 +303,8 @@ class Node(object):
 
         If `condition` is not None, the iterable contains only nodes
         for which ``condition(node)`` is true.  If `condition` is a
-        node class ``cls``, it is equivalent to a function consisting
-        of ``return isinstance(node, cls)``.
+        node class ``cls`` (or a tuple of node classes), it is equivalent
+        to a function consisting of ``return isinstance(node, cls)``.
 
         If ascend is true, assume siblings to be true as well.
 
@@ -247,35 +333,53 @@ class Node(object):
         if include_self and descend and not siblings:
             if condition is None:
                 return self._all_traverse()
-            elif isinstance(condition, (types.ClassType, type)):
+            elif isinstance(condition, (types.ClassType, type, tuple)):
                 return self._fast_traverse(condition)
+        return list(self.iter_traverse(condition, include_self, descend,
+                                       siblings, ascend))
+
+    def iter_traverse(self, condition=None,
+                      include_self=1, descend=1, siblings=0, ascend=0):
+        """
+        Return an iterator over the nodes `traverse()` would return, with
+        the same parameters and in the same order.
+
+        Nodes are found as the iteration proceeds, without building a list
+        first and without recursion, so stopping early is cheap.  Unlike
+        the result of `traverse()`, the iterator is affected by changes to
+        the tree made while iterating; use `traverse()` to modify the
+        nodes found.
+        """
+        if ascend:
+            siblings=1
         # Check if `condition` is a class (check for TypeType for Python
-        # implementations that use only new-style classes, like PyPy).
-        if isinstance(condition, (types.ClassType, type)):
+        # implementations that use only new-style classes, like PyPy) or a
+        # tuple of classes.
+        if isinstance(condition, (types.ClassType, type, tuple)):
             node_class = condition
             def condition(node, node_class=node_class):
                 return isinstance(node, node_class)
-        r = []
         if include_self and (condition is None or condition(self)):
-            r.append(self)
-        if descend and len(self.children):
-            for child in self:
-                r.extend(child.traverse(
-                    include_self=1, descend=1, siblings=0, ascend=0,
-                    condition=condition))
-        if siblings or ascend:
+            yield self
+        if descend:
+            for node in self._iter_descendants():
+                if condition is None or condition(node):
+                    yield node
+        if siblings:
             node = self
             while node.parent:
                 index = node.parent.index(node)
                 for sibling in node.parent[index+1:]:
-                    r.extend(sibling.traverse(include_self=1, descend=descend,
-                                              siblings=0, ascend=0,
-                                              condition=condition))
+                    if condition is None or condition(sibling):
+                        yield sibling
+                    if descend:
+                        for descendant in sibling._iter_descendants():
+                            if condition is None or condition(descendant):
+                                yield descendant
                 if not ascend:
                     break
                 else:
                     node = node.parent
-        return r
 
     def next_node(self, condition=None,
                   include_self=0, descend=1, siblings=0, ascend=0):
@@ -286,13 +390,12 @@ class Node(object):
         Parameter list is the same as of traverse.  Note that
         include_self defaults to 0, though.
         """
-        iterable = self.traverse(condition=condition,
-                                 include_self=include_self, descend=descend,
-                                 siblings=siblings, ascend=ascend)
-        try:
-            return iterable[0]
-        except IndexError:
-            return None
+        for node in self.iter_traverse(condition=condition,
+                                       include_self=include_self,
+                                       descend=descend, siblings=siblings,
+                                       ascend=ascend):
+            return node
+        return None
 
 if sys.version_info < (3,):
     class reprunicode(unicode):
@@ -382,6 +485,55 @@ class Text(Node, reprunicode):
     def lstrip(self, chars=None):
         return self.__class__(reprunicode.lstrip(self, chars))
 
+class Attributes(dict):
+
+    """
+    Dictionary of element attributes {name: value}.
+
+    The list attributes (`Element.list_attributes`) always appear to be
+    present, but their lists are only created when first looked up, so
+    that most elements do without five empty lists.  Iteration and
+    `len()` only see the list attributes created so far.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, key):
+        if key in Element.list_attributes:
+            value = self[key] = []
+            return value
+        raise KeyError(key)
+
+    if sys.version_info < (2, 5):
+        # ``__missing__`` is only supported by Python 2.5 and later.
+        def __getitem__(self, key):
+            try:
+                return dict.__getitem__(self, key)
+            except KeyError:
+                return self.__missing__(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in Element.list_attributes
+
+    has_key = __contains__
+
+    def __delitem__(self, key):
+        if key in Element.list_attributes:
+            dict.pop(self, key, None)
+        else:
+            dict.__delitem__(self, key)
+
+    def get(self, key, failobj=None):
+        if key in Element.list_attributes:
+            return self[key]            # callers may change the list
+        return dict.get(self, key, failobj)
+
+    def setdefault(self, key, failobj=None):
+        if key in Element.list_attributes:
+            return self[key]
+        return dict.setdefault(self, key, failobj)
+
+
 class Element(Node):
 
     """
@@ -419,18 +571,24 @@ class Element(Node):
     This is equivalent to ``element.extend([node1, node2])``.
     """
 
+    __slots__ = ('rawsource', 'children', 'attributes', 'tagname',
+                 'parent', 'document', 'source', 'line', '__dict__')
+    """The common instance attributes are stored in slots.  The instance
+    dictionary, for any other attributes, is only created when needed.
+
+    `tagname` is the element generic identifier.  Subclasses may set it as
+    a class attribute; otherwise it is set to the name of the class."""
+
     list_attributes = ('ids', 'classes', 'names', 'dupnames', 'backrefs')
     """List attributes, automatically initialized to empty lists for
-    all nodes."""
-
-    tagname = None
-    """The element generic identifier. If None, it is set as an instance
-    attribute to the name of the class."""
+    all nodes (see `Attributes`)."""
 
     child_text_separator = '\n\n'
     """Separator for child nodes, used by `astext()` method."""
 
     def __init__(self, rawsource='', *children, **attributes):
+        self.parent = self.document = self.source = self.line = None
+
         self.rawsource = rawsource
         """The raw text from which this element was constructed."""
 
@@ -439,13 +597,9 @@ class Element(Node):
 
         self.extend(children)           # maintain parent info
 
-        self.attributes = {}
+        self.attributes = Attributes()
         """Dictionary of attribute {name: value}."""
 
-        # Initialize list attributes.
-        for att in self.list_attributes:
-            self.attributes[att] = []
-
         for att, value in attributes.items():
             att = att.lower()
             if att in self.list_attributes:
@@ -454,9 +608,24 @@ class Element(Node):
             else:
                 self.attributes[att] = value
 
-        if self.tagname is None:
+        if getattr(self, 'tagname', None) is None:
             self.tagname = self.__class__.__name__
 
+    def __getstate__(self):
+        """
+        Return a dictionary of all instance attributes (slots included),
+        for pickling and copying.
+        """
+        state = self.__dict__.copy()
+        for name in Element.__slots__[:-1]:
+            if name not in state and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def _dom_node(self, domroot):
         element = domroot.createElement(self.tagname)
         for attribute, value in self.attlist():
@@ -545,10 +714,17 @@ class Element(Node):
         if isinstance(key, basestring):
             self.attributes[str(key)] = item
         elif isinstance(key, int):
+            if (self.document is not None
+                and self.document.node_index is not None):
+                self.update_node_index([self.children[key], item])
             self.setup_child(item)
             self.children[key] = item
         elif isinstance(key, types.SliceType):
             assert key.step in (None, 1), 'cannot handle slice with stride'
+            if (self.document is not None
+                and self.document.node_index is not None):
+                self.update_node_index(
+                    self.children[key.start:key.stop] + list(item))
             for node in item:
                 self.setup_child(node)
             self.children[key.start:key.stop] = item
@@ -560,9 +736,15 @@ class Element(Node):
         if isinstance(key, basestring):
             del self.attributes[key]
         elif isinstance(key, int):
+            if (self.document is not None
+                and self.document.node_index is not None):
+                self.update_node_index([self.children[key]])
             del self.children[key]
         elif isinstance(key, types.SliceType):
             assert key.step in (None, 1), 'cannot handle slice with stride'
+            if (self.document is not None
+                and self.document.node_index is not None):
+                self.update_node_index(self.children[key.start:key.stop])
             del self.children[key.start:key.stop]
         else:
             raise TypeError, ('element index must be an integer, a simple '
@@ -617,6 +799,9 @@ class Element(Node):
     __contains__ = hasattr
 
     def append(self, item):
+        if (self.document is not None
+            and self.document.node_index is not None):
+            self.update_node_index([item])
         self.setup_child(item)
         self.children.append(item)
 
@@ -626,15 +811,24 @@ class Element(Node):
 
     def insert(self, index, item):
         if isinstance(item, Node):
+            if (self.document is not None
+                and self.document.node_index is not None):
+                self.update_node_index([item])
             self.setup_child(item)
             self.children.insert(index, item)
         elif item is not None:
             self[index:index] = item
 
     def pop(self, i=-1):
+        if (self.document is not None
+            and self.document.node_index is not None):
+            self.update_node_index([self.children[i]])
         return self.children.pop(i)
 
     def remove(self, item):
+        if (self.document is not None
+            and self.document.node_index is not None):
+            self.update_node_index([item])
         self.children.remove(item)
 
     def index(self, item):
@@ -659,8 +853,35 @@ class Element(Node):
                     self[att].append(value)
 
     def clear(self):
+        if (self.document is not None
+            and self.document.node_index is not None):
+            self.update_node_index(self.children)
         self.children = []
 
+    def update_node_index(self, nodes):
+        """
+        Report a change of children to the node index of `self.document`
+        (see `document.enable_node_index()`): `nodes` (a list) are added or
+        removed.  The index entries for their classes and the classes of
+        their descendants are dropped, to be rebuilt when needed.
+
+        The elements among `nodes` and their descendants get
+        `self.document` as their ``document``, so that later changes of
+        their children are reported as well.
+        """
+        document = self.document
+        node_index = document.node_index
+        classes = {}
+        for node in nodes:
+            for descendant in node.traverse():
+                classes[descendant.__class__] = 1
+                if isinstance(descendant, Element):
+                    descendant.document = document
+        for node_class in classes.keys():
+            for base in class_bases(node_class):
+                if base in node_index:
+                    del node_index[base]
+
     def replace(self, old, new):
         """Replace one child `Node` with another child or children."""
         index = self.index(old)
@@ -742,8 +963,55 @@ class Element(Node):
         return self.__class__(rawsource=self.rawsource, **self.attributes)
 
     def deepcopy(self):
-        copy = self.copy()
-        copy.extend([child.deepcopy() for child in self.children])
+        """
+        Return a deep copy of self (also copying children).
+
+        The subtree is copied without recursion.  Nodes of classes using
+        the `Element` (or `TextElement`, `FixedTextElement`) initializer
+        and `copy()` method, and plain `Text` nodes, are copied directly
+        instead of through `copy()` and ``__init__()``, with the same
+        result.  This keeps copying subtrees many times (e.g. substitution
+        definitions, one copy per reference) cheap.
+        """
+        try:
+            kind = _copy_kinds[self.__class__]
+        except KeyError:
+            kind = _copy_kind(self.__class__)
+        if kind >= _copy_element:
+            copy = _plain_copy(self, kind)
+        else:
+            copy = self.copy()
+        # The ``document`` of a copy is the one set by `copy()`, not
+        # inherited from the new parent (children are added to a copy
+        # before it is added to its parent):
+        stack = [(copy, copy.document, self.children)]
+        while stack:
+            parent, document, children = stack.pop()
+            new_children = parent.children
+            for child in children:
+                cls = child.__class__
+                try:
+                    kind = _copy_kinds[cls]
+                except KeyError:
+                    kind = _copy_kind(cls)
+                if kind == _copy_text:
+                    new = cls.__new__(cls, child)
+                    new.rawsource = child.rawsource
+                elif kind >= _copy_element:
+                    new = _plain_copy(child, kind)
+                    if child.children:
+                        stack.append((new, None, child.children))
+                elif kind == _copy_shallow:
+                    new = child.copy()
+                    if child.children:
+                        stack.append((new, new.document, child.children))
+                else:
+                    new = child.deepcopy()
+                if document is None:
+                    new.parent = parent
+                else:
+                    parent.setup_child(new)
+                new_children.append(new)
         return copy
 
     def set_class(self, name):
@@ -975,17 +1243,60 @@ class document(Root, Structural, Element):
         self.decoration = None
         """Document's `decoration` node."""
 
+        self.node_index = None
+        """Mapping of {node class: list of the nodes of that class (or
+        subclasses) in the document, in tree order}, if enabled by
+        `enable_node_index()`; None otherwise."""
+
         self.document = self
 
     def __getstate__(self):
         """
         Return dict with unpicklable references removed.
         """
-        state = self.__dict__.copy()
+        state = Element.__getstate__(self)
         state['reporter'] = None
         state['transformer'] = None
+        state['node_index'] = None
         return state
 
+    def enable_node_index(self):
+        """
+        Keep an index of the document's nodes by class, so that repeated
+        ``document.traverse(node_class)`` calls do not walk the whole tree
+        each time.
+
+        The index is filled on demand and kept up to date through the
+        `Element` methods that change children (`Element.append()`,
+        `Element.insert()`, ``element[i] = node``, ``del element[i]``
+        etc.), which check the index of their element's ``document`` (set
+        for all elements of the document here).  Code changing the
+        ``children`` lists of elements directly must not be used while
+        the index is enabled.
+        """
+        if self.node_index is None:
+            self.node_index = {}
+            for element in self._fast_traverse(Element):
+                element.document = self
+
+    def traverse(self, condition=None,
+                 include_self=1, descend=1, siblings=0, ascend=0):
+        """
+        Extend `Node.traverse()`: answer ``traverse(node_class)`` from the
+        node index, if enabled.
+        """
+        if (self.node_index is None
+            or not isinstance(condition, (types.ClassType, type))
+            or not include_self or not descend or siblings or ascend):
+            return Element.traverse(self, condition, include_self, descend,
+                                    siblings, ascend)
+        try:
+            result = self.node_index[condition]
+        except KeyError:
+            result = self.node_index[condition] = self._fast_traverse(
+                condition)
+        return result[:]
+
     def asdom(self, dom=None):
         """Return a DOM representation of this document."""
         if dom is None:
@@ -1587,20 +1898,50 @@ class NodeVisitor:
     Used to ensure transitional compatibility with existing 3rd-party writers.
     """
 
+    _dispatch_names = {}
+    """
+    Mapping of node classes to their (``visit_...``, ``depart_...``)
+    method names, filled in as node classes are encountered.
+
+    Only the names are cached: the methods are looked up on the visitor
+    at every dispatch, so methods assigned to a visitor instance or
+    added to its class later are called.
+    """
+
     def __init__(self, document):
         self.document = document
 
+    def dispatch_names(self, node_class):
+        """
+        Return the (``visit_...``, ``depart_...``) method names for
+        `node_class`.
+        """
+        try:
+            return self._dispatch_names[node_class]
+        except KeyError:
+            name = node_class.__name__
+            names = self._dispatch_names[node_class] = ('visit_' + name,
+                                                        'depart_' + name)
+            return names
+
     def dispatch_visit(self, node):
         """
         Call self."``visit_`` + node class name" with `node` as
         parameter.  If the ``visit_...`` method does not exist, call
         self.unknown_visit.
         """
-        node_name = node.__class__.__name__
-        method = getattr(self, 'visit_' + node_name, self.unknown_visit)
-        self.document.reporter.debug(
-            'docutils.nodes.NodeVisitor.dispatch_visit calling %s for %s'
-            % (method.__name__, node_name))
+        try:
+            name = self._dispatch_names[node.__class__][0]
+        except KeyError:
+            name = self.dispatch_names(node.__class__)[0]
+        method = getattr(self, name, None)
+        if method is None:
+            method = self.unknown_visit
+        reporter = self.document.reporter
+        if reporter.debug_flag:
+            reporter.debug(
+                'docutils.nodes.NodeVisitor.dispatch_visit calling %s for %s'
+                % (method.__name__, node.__class__.__name__))
         return method(node)
 
     def dispatch_departure(self, node):
@@ -1609,11 +1950,18 @@ class NodeVisitor:
         parameter.  If the ``depart_...`` method does not exist, call
         self.unknown_departure.
         """
-        node_name = node.__class__.__name__
-        method = getattr(self, 'depart_' + node_name, self.unknown_departure)
-        self.document.reporter.debug(
-            'docutils.nodes.NodeVisitor.dispatch_departure calling %s for %s'
-            % (method.__name__, node_name))
+        try:
+            name = self._dispatch_names[node.__class__][1]
+        except KeyError:
+            name = self.dispatch_names(node.__class__)[1]
+        method = getattr(self, name, None)
+        if method is None:
+            method = self.unknown_departure
+        reporter = self.document.reporter
+        if reporter.debug_flag:
+            reporter.debug(
+                'docutils.nodes.NodeVisitor.dispatch_departure calling %s '
+                'for %s' % (method.__name__, node.__class__.__name__))
         return method(node)
 
     def unknown_visit(self, node):
@@ -1913,6 +2261,88 @@ def serial_escape(value):
     """Escape string values that are elements of a list, for serialization."""
     return value.replace('\\', r'\\').replace(' ', r'\ ')
 
+_copy_kinds = {}
+"""Mapping of node classes to the way `Element.deepcopy()` copies their
+instances (see `_copy_kind()`)."""
+
+(_copy_deep, _copy_shallow, _copy_text, _copy_element,
+ _copy_text_element, _copy_fixed_text_element) = range(6)
+
+def _copy_kind(node_class):
+    """
+    Return (and cache) the way `Element.deepcopy()` copies instances of
+    `node_class`:
+
+    - `_copy_text`, `_copy_element`, `_copy_text_element`,
+      `_copy_fixed_text_element`: directly, for classes using the copy
+      methods and initializer of `Text`, `Element`, `TextElement` or
+      `FixedTextElement`.
+    - `_copy_shallow`: with `copy()`, then copying the children (other
+      classes not overriding `Element.deepcopy()`).
+    - `_copy_deep`: with the class's own `deepcopy()`.
+    """
+    def method(name):
+        for base in class_bases(node_class):
+            if name in base.__dict__:
+                return base.__dict__[name]
+    if issubclass(node_class, Text):
+        if (method('copy') is Text.__dict__['copy']
+            and method('deepcopy') is Text.__dict__['deepcopy']
+            and method('__init__') is Text.__dict__['__init__']
+            and method('__new__') is Text.__dict__['__new__']):
+            kind = _copy_text
+        else:
+            kind = _copy_deep
+    elif method('deepcopy') is not Element.__dict__['deepcopy']:
+        kind = _copy_deep
+    elif (method('copy') is not Element.__dict__['copy']
+          or method('__new__') is not object.__dict__['__new__']):
+        kind = _copy_shallow
+    else:
+        kind = {Element.__dict__['__init__']: _copy_element,
+                TextElement.__dict__['__init__']: _copy_text_element,
+                FixedTextElement.__dict__['__init__']:
+                _copy_fixed_text_element}.get(method('__init__'),
+                                              _copy_shallow)
+    _copy_kinds[node_class] = kind
+    return kind
+
+def _plain_copy(element, kind):
+    """
+    Return ``element.copy()`` for an `element` of a class using the
+    `Element` copy method and initializer (`kind` is its `_copy_kind()`),
+    without calling the initializer.
+    """
+    cls = element.__class__
+    new = cls.__new__(cls)
+    new.parent = new.document = new.source = new.line = None
+    new.rawsource = element.rawsource
+    new.children = []
+    new.attributes = attributes = Attributes()
+    list_attributes = new.list_attributes
+    for att, value in element.attributes.items():
+        att = att.lower()
+        if att in list_attributes:
+            value = value[:]
+        attributes[att] = value
+    if kind == _copy_fixed_text_element:
+        attributes['xml:space'] = 'preserve'
+    if getattr(new, 'tagname', None) is None:
+        new.tagname = cls.__name__
+    return new
+
+_class_bases = {}
+
+def class_bases(node_class):
+    """
+    Return a tuple of `node_class` and all of its base classes (cached).
+    """
+    try:
+        return _class_bases[node_class]
+    except KeyError:
+        bases = _class_bases[node_class] = inspect.getmro(node_class)
+        return bases
+
 # 
 #
 # Local Variables:
@@ -70,10 +70,12 @@ appropriate).
 __docformat__ = 'reStructuredText'
 
 
+import re
+import docutils.io
 import docutils.parsers
 import docutils.statemachine
-from docutils.parsers.rst import states
-from docutils import frontend, nodes
+from docutils.parsers.rst import states, languages
+from docutils import frontend, nodes, utils
 
 
 class Parser(docutils.parsers.Parser):
@@ -131,11 +133,55 @@ class Parser(docutils.parsers.Parser):
            'validator': frontend.validate_boolean}),
          ('Enable the "raw" directive.  Enabled by default.',
           ['--raw-enabled'],
-          {'action': 'store_true'}),))
+          {'action': 'store_true'}),
+         ('Timeout in seconds for fetching the "url" of "raw" and '
+          '"csv-table" directives.  Default: no timeout.',
+          ['--url-timeout'],
+          {'metavar': '<seconds>', 'type': 'float',
+           'validator': frontend.validate_nonnegative_float}),
+         ('Cache the data fetched from HTTP URLs in <directory>, and only '
+          'fetch it again if it changed.',
+          ['--url-cache'], {'metavar': '<directory>'}),
+         ('Fetch the URLs of the "raw" and "csv-table" directives of a '
+          'document concurrently before parsing (literal blocks, comments '
+          'and the contents of most other directives are not searched).',
+          ['--url-prefetch'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Fetch directive URLs one at a time, when the directive is '
+          'parsed.  (default)',
+          ['--no-url-prefetch'],
+          {'dest': 'url_prefetch', 'action': 'store_false'}),))
 
     config_section = 'restructuredtext parser'
     config_section_dependencies = ('parsers',)
 
+    relative_path_settings = ('url_cache',)
+
+    url_directive_pattern = re.compile(
+        r'^[ \t]*\.\.[ \t]+([\w.+-]+)[ \t]*::.*\n'     # directive start
+        r'(?:[ \t]+\S.*\n)*?'                           # arguments, options
+        r'[ \t]+:url:[ \t]+(\S+)[ \t]*$', re.MULTILINE | re.UNICODE)
+    """Matches directives with a "url" option (groups: name, URL)."""
+
+    url_directives = ('raw', 'csv-table')
+    """Canonical names of the directives whose URLs are prefetched."""
+
+    url_container_directives = (
+        'attention', 'caution', 'danger', 'error', 'hint', 'important',
+        'note', 'tip', 'warning', 'admonition', 'sidebar', 'topic',
+        'epigraph', 'highlights', 'pull-quote', 'compound', 'container',
+        'figure', 'header', 'footer', 'class')
+    """Canonical names of the directives whose content is searched for
+    directives with URLs to prefetch (the content of other directives may
+    not be parsed as body elements, and is skipped)."""
+
+    directive_start_pattern = re.compile(
+        r'[ \t]*\.\.[ \t]+([\w.+-]+)[ \t]*::', re.UNICODE)
+    """Matches the start of a directive (group: directive name)."""
+
+    comment_start_pattern = re.compile(r'[ \t]*\.\.(?:[ \t]+(?![_\[|])|$)')
+    """Matches the start of a comment, if not a directive."""
+
     def __init__(self, rfc2822=None, inliner=None):
         if rfc2822:
             self.initial_state = 'RFC2822Body'
@@ -147,16 +193,133 @@ class Parser(docutils.parsers.Parser):
     def parse(self, inputstring, document):
         """Parse `inputstring` and populate `document`, a document tree."""
         self.setup_parse(inputstring, document)
-        self.statemachine = states.RSTStateMachine(
+        self.prefetch_urls(inputstring, document)
+        self.statemachine = states.state_machine_pool.get(
+              states.RSTStateMachine,
               state_classes=self.state_classes,
               initial_state=self.initial_state,
               debug=document.reporter.debug_flag)
+        if getattr(document.settings, 'profile_parse', None):
+            self.statemachine.profile = document.parse_profile = \
+                docutils.statemachine.Profile()
         inputlines = docutils.statemachine.string2lines(
               inputstring, tab_width=document.settings.tab_width,
               convert_whitespace=1)
         self.statemachine.run(inputlines, document, inliner=self.inliner)
+        locator = getattr(document.reporter, 'locator', None)
+        if getattr(locator, 'im_self', None) is self.statemachine:
+            # The state machine is reset for reuse, the locator is not:
+            document.reporter.locator = docutils.statemachine.LineLocator(
+                self.statemachine).get_source_and_line
+        states.state_machine_pool.put(self.statemachine)
+        self.statemachine = None
         self.finish_parse()
 
+    def prefetch_urls(self, inputstring, document):
+        """
+        If the "url_prefetch" setting is true, fetch the URLs of the "raw"
+        and "csv-table" directives in `inputstring` (as far as found by
+        `url_search_text()`) concurrently with `docutils.io.url_fetcher`,
+        so that the directives don't wait for them in turn.
+        """
+        settings = document.settings
+        if (':url:' not in inputstring
+            or not getattr(settings, 'url_prefetch', None)
+            or not getattr(settings, 'file_insertion_enabled', 1)):
+            return
+        urls = []
+        for match in self.url_directive_pattern.finditer(
+              self.url_search_text(inputstring, settings)):
+            canonical = self.canonical_directive_name(match.group(1),
+                                                      settings)
+            if canonical not in self.url_directives:
+                continue
+            if canonical == 'raw' and not getattr(settings, 'raw_enabled', 1):
+                continue
+            urls.append(match.group(2))
+        if urls:
+            docutils.io.url_fetcher.prefetch(
+                urls, getattr(settings, 'url_timeout', None),
+                getattr(settings, 'url_cache', None))
+
+    def canonical_directive_name(self, name, settings):
+        """Return the canonical (English) name of the directive `name`."""
+        from docutils.parsers.rst import directives
+        name = name.lower()
+        language = languages.get_language(settings.language_code)
+        return (language and language.directives.get(name)
+                or directives._fallback_language_module.directives.get(
+                    name, name))
+
+    def url_search_text(self, inputstring, settings):
+        """
+        Return `inputstring` with the lines which cannot contain directives
+        to prefetch URLs for blanked out: literal blocks, comments, the
+        contents of directives not in `self.url_container_directives`, and
+        the contents after the options of the "raw" and "csv-table"
+        directives.  Indented blocks are skipped generously; a URL missed
+        here is fetched when its directive is parsed.
+        """
+        lines = []
+        skip_indent = None              # skip the lines indented deeper
+        keep_options = 0                # but not up to the first blank line
+        for line in inputstring.splitlines():
+            stripped = line.lstrip()
+            indent = (len(line.expandtabs(settings.tab_width))
+                      - len(stripped.expandtabs(settings.tab_width)))
+            if skip_indent is not None:
+                if stripped and indent <= skip_indent:
+                    skip_indent = None
+                elif keep_options and stripped:
+                    lines.append(line)
+                    continue
+                else:
+                    keep_options = 0
+                    lines.append('')
+                    continue
+            lines.append(line)
+            match = self.directive_start_pattern.match(line)
+            if match:
+                canonical = self.canonical_directive_name(match.group(1),
+                                                          settings)
+                if canonical in self.url_directives:
+                    skip_indent, keep_options = indent, 1
+                elif canonical not in self.url_container_directives:
+                    skip_indent = indent
+            elif (self.comment_start_pattern.match(line)
+                  or stripped.rstrip().endswith('::')):
+                # comment or literal block
+                skip_indent = indent
+        return '\n'.join(lines) + '\n'
+
+    def reparse(self, inputstring, document, start, old_stop, new_stop):
+        """
+        Update `document` after an edit of the input it was parsed from,
+        re-parsing only the affected top-level sections.
+
+        Lines ``start:old_stop`` of the old input have been replaced by
+        lines ``start:new_stop`` of `inputstring`, the complete new input.
+        Return the updated document: `document` itself, or a new document
+        if the edit required a full parse.
+        """
+        self.inputstring = inputstring
+        self.document = document
+        self.statemachine = states.RSTStateMachine(
+              state_classes=self.state_classes,
+              initial_state=self.initial_state,
+              debug=document.reporter.debug_flag)
+        inputlines = docutils.statemachine.StringList(
+              docutils.statemachine.string2lines(
+                  inputstring, tab_width=document.settings.tab_width,
+                  convert_whitespace=1),
+              document['source'])
+        if self.statemachine.reparse(inputlines, document, start, old_stop,
+                                     new_stop, inliner=self.inliner):
+            return document
+        document = utils.new_document(document['source'], document.settings)
+        self.parse(inputstring, document)
+        return document
+
 
 class DirectiveError(Exception):
 
@@ -15,11 +15,14 @@ from docutils.parsers.rst import states
 from docutils.transforms import components
 
 
+class meta(nodes.Special, nodes.PreBibliographic, nodes.Element):
+    """HTML-specific "meta" element."""
+    pass
+
+
 class MetaBody(states.SpecializedBody):
 
-    class meta(nodes.Special, nodes.PreBibliographic, nodes.Element):
-        """HTML-specific "meta" element."""
-        pass
+    meta = meta                         # module-level, for pickling
 
     def field_marker(self, match, context, next_state):
         """Meta element."""
@@ -15,6 +15,80 @@ from docutils.parsers.rst import Directive, convert_directive_function
 from docutils.parsers.rst import directives, roles, states
 from docutils.transforms import misc
 
+
+class IncludeCache:
+
+    """
+    Results of recent file inclusions, shared by all documents processed.
+
+    Keys identify the file (absolute path, modification time, size and
+    inode) together with everything else the result depends on (encoding,
+    error handler, tab width, start/end options, literal or parsed).
+    Values are the decoded text after applying the start/end options, and
+    its line-split form for parsed inclusions.  Least recently used entries
+    are dropped beyond `max_entries`.
+    """
+
+    max_entries = 128
+    """Maximum number of cached inclusions (0: disable caching)."""
+
+    def __init__(self):
+        self.entries = {}
+        """Mapping of {key: [last use, result]}."""
+
+        self.clock = 0
+        """Incremented on every lookup; orders the entries by last use."""
+
+        self.hits = 0
+        """Number of lookups answered from the cache."""
+
+        self.misses = 0
+        """Number of lookups not answered from the cache."""
+
+    def make_key(self, path, *options):
+        """
+        Return a cache key for file `path` & `options` (hashable values),
+        or None if the file can't be examined.
+        """
+        try:
+            stat = os.stat(path)
+        except (OSError, UnicodeError):
+            return None
+        return ((os.path.abspath(path), stat.st_mtime, stat.st_size,
+                 stat.st_ino) + options)
+
+    def get(self, key):
+        """Return the cached result for `key`, or None."""
+        self.clock += 1
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry[0] = self.clock
+        return entry[1]
+
+    def put(self, key, result):
+        """Store `result` for `key`, dropping the least recently used."""
+        if key is None or self.max_entries <= 0:
+            return
+        self.entries[key] = [self.clock, result]
+        if len(self.entries) > self.max_entries:
+            by_use = [(entry[0], entry_key)
+                      for entry_key, entry in self.entries.items()]
+            by_use.sort()
+            for last_use, entry_key in by_use[:-self.max_entries]:
+                del self.entries[entry_key]
+
+    def clear(self):
+        """Drop all entries (the counters are kept)."""
+        self.entries.clear()
+
+
+include_cache = IncludeCache()
+"""Cache for the "include" directive."""
+
+
 class Include(Directive):
 
     """
@@ -58,13 +132,27 @@ class Include(Directive):
             'encoding', self.state.document.settings.input_encoding)
         tab_width = self.options.get(
             'tab-width', self.state.document.settings.tab_width)
+        error_handler = (self.state.document.settings.\
+                         input_encoding_error_handler)
+        startline = self.options.get('start-line', None)
+        endline = self.options.get('end-line', None)
+        after_text = self.options.get('start-after', None)
+        before_text = self.options.get('end-before', None)
+        literal = 'literal' in self.options
+        self.state.document.settings.record_dependencies.add(path)
+        cache_key = None
+        if include_cache.max_entries > 0:
+            cache_key = include_cache.make_key(
+                path, encoding, error_handler, tab_width, startline, endline,
+                after_text, before_text, literal)
+        if cache_key is not None:
+            result = include_cache.get(cache_key)
+            if result is not None:
+                return self.include(path, literal, *result)
         try:
-            self.state.document.settings.record_dependencies.add(path)
             include_file = io.FileInput(
                 source_path=path, encoding=encoding,
-                error_handler=(self.state.document.settings.\
-                               input_encoding_error_handler),
-                handle_io_errors=None)
+                error_handler=error_handler, handle_io_errors=None)
         except IOError, error:
             raise self.severe('Problems with "%s" directive path:\n%s: %s.' %
                         (self.name, error.__class__.__name__, str(error)))
@@ -74,8 +162,6 @@ class Include(Directive):
             # fallback `__repr__` does not report the file name. Explicitely
             # converting to str fixes this for now::
             #   print '%s\n%s\n%s\n' %(error, str(error), repr(error))
-        startline = self.options.get('start-line', None)
-        endline = self.options.get('end-line', None)
         try:
             if startline or (endline is not None):
                 lines = include_file.readlines()
@@ -88,7 +174,6 @@ class Include(Directive):
                 % (self.name, error.__class__.__name__, error))
         # start-after/end-before: no restrictions on newlines in match-text,
         # and no restrictions on matching inside lines vs. line boundaries
-        after_text = self.options.get('start-after', None)
         if after_text:
             # skip content in rawtext before *and incl.* a matching text
             after_index = rawtext.find(after_text)
@@ -96,7 +181,6 @@ class Include(Directive):
                 raise self.severe('Problem with "start-after" option of "%s" '
                                   'directive:\nText not found.' % self.name)
             rawtext = rawtext[after_index + len(after_text):]
-        before_text = self.options.get('end-before', None)
         if before_text:
             # skip content in rawtext after *and incl.* a matching text
             before_index = rawtext.find(before_text)
@@ -104,19 +188,29 @@ class Include(Directive):
                 raise self.severe('Problem with "end-before" option of "%s" '
                                   'directive:\nText not found.' % self.name)
             rawtext = rawtext[:before_index]
-        if 'literal' in self.options:
+        if literal:
             # Convert tabs to spaces, if `tab_width` is positive.
             if tab_width >= 0:
                 text = rawtext.expandtabs(tab_width)
             else:
                 text = rawtext
+        else:
+            text = statemachine.string2lines(
+                rawtext, tab_width, convert_whitespace=1)
+        include_cache.put(cache_key, (rawtext, text))
+        return self.include(path, literal, rawtext, text)
+
+    def include(self, path, literal, rawtext, text):
+        """
+        Include the `rawtext` of file `path` as a literal block (of `text`),
+        or parse it (the list of lines `text`).
+        """
+        if literal:
             literal_block = nodes.literal_block(rawtext, text, source=path)
             literal_block.line = 1
             return [literal_block]
         else:
-            include_lines = statemachine.string2lines(
-                rawtext, tab_width, convert_whitespace=1)
-            self.state_machine.insert_input(include_lines, path)
+            self.state_machine.insert_input(text, path)
             return []
 
 
@@ -187,8 +281,11 @@ class Raw(Directive):
             # it may fail due to broken SSL dependencies, and it takes
             # about 0.15 seconds to load.
             import urllib2
+            settings = self.state.document.settings
             try:
-                raw_text = urllib2.urlopen(source).read()
+                raw_text = io.url_fetcher.fetch(
+                    source, getattr(settings, 'url_timeout', None),
+                    getattr(settings, 'url_cache', None))
             except (urllib2.URLError, IOError, OSError), error:
                 raise self.severe(
                     'Problems with "%s" directive URL "%s":\n%s.'
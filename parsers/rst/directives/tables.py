@@ -11,12 +11,13 @@ __docformat__ = 'reStructuredText'
 
 import sys
 import os.path
+import re
 import csv
 
 from docutils import io, nodes, statemachine, utils
 from docutils.utils import SystemMessagePropagation
 from docutils.parsers.rst import Directive
-from docutils.parsers.rst import directives
+from docutils.parsers.rst import directives, states
 
 
 class Table(Directive):
@@ -189,6 +190,15 @@ class CSVTable(Table):
         lineterminator = '\n'
         quoting = csv.QUOTE_MINIMAL
 
+    plain_cell_fast_path = 1
+    """Add cells of plain text as paragraphs directly, without parsing?"""
+
+    plain_cell_pattern = re.compile(
+        u'(?!\\s)[^\x00-\x1f\x7f-\x9f\u2028\u2029*`|_\\[\\]\\\\:@<>]+\\Z',
+        re.UNICODE)
+    """Matches a single line of text without inline markup characters,
+    starting with a non-whitespace character."""
+
     def check_requirements(self):
         pass
 
@@ -206,17 +216,17 @@ class CSVTable(Table):
             title, messages = self.make_title()
             csv_data, source = self.get_csv_data()
             table_head, max_header_cols = self.process_header_option()
-            rows, max_cols = self.parse_csv_data_into_rows(
-                csv_data, self.DocutilsDialect(self.options), source)
+            rows, max_cols = self.read_csv_rows(
+                csv_data, self.DocutilsDialect(self.options))
             max_cols = max(max_cols, max_header_cols)
             header_rows = self.options.get('header-rows', 0)
             stub_columns = self.options.get('stub-columns', 0)
             self.check_table_dimensions(rows, header_rows, stub_columns)
-            table_head.extend(rows[:header_rows])
-            table_body = rows[header_rows:]
+            table_head.extend([self.cell_blocks(row, source)
+                               for row in rows[:header_rows]])
+            del rows[:header_rows]
             col_widths = self.get_column_widths(max_cols)
-            self.extend_short_rows_with_empty_cells(max_cols,
-                                                    (table_head, table_body))
+            self.extend_short_rows_with_empty_cells(max_cols, (table_head,))
         except SystemMessagePropagation, detail:
             return [detail.args[0]]
         except csv.Error, detail:
@@ -225,9 +235,14 @@ class CSVTable(Table):
                 % (self.name, detail), nodes.literal_block(
                 self.block_text, self.block_text), line=self.lineno)
             return [error]
-        table = (col_widths, table_head, table_body)
+        table = (col_widths, table_head, [])
         table_node = self.state.build_table(table, self.content_offset,
                                             stub_columns)
+        tbody = table_node[0][-1]
+        # Build the body row by row, releasing the cell texts as we go:
+        rows.reverse()
+        while rows:
+            tbody += self.build_csv_row(rows.pop(), max_cols, source)
         table_node['classes'] += self.options.get('class', [])
         if title:
             table_node.insert(0, title)
@@ -271,7 +286,7 @@ class CSVTable(Table):
                     error_handler=(self.state.document.settings.\
                                    input_encoding_error_handler),
                     handle_io_errors=None)
-                csv_data = csv_file.read().splitlines()
+                csv_data = self.iter_lines(csv_file.read())
             except IOError, error:
                 severe = self.state_machine.reporter.severe(
                     'Problems with "%s" directive path:\n%s.'
@@ -285,8 +300,11 @@ class CSVTable(Table):
             # about 0.15 seconds to load.
             import urllib2
             source = self.options['url']
+            settings = self.state.document.settings
             try:
-                csv_text = urllib2.urlopen(source).read()
+                csv_text = io.url_fetcher.fetch(
+                    source, getattr(settings, 'url_timeout', None),
+                    getattr(settings, 'url_cache', None))
             except (urllib2.URLError, IOError, OSError, ValueError), error:
                 severe = self.state_machine.reporter.severe(
                       'Problems with "%s" directive URL "%s":\n%s.'
@@ -298,7 +316,7 @@ class CSVTable(Table):
                 source=csv_text, source_path=source, encoding=encoding,
                 error_handler=(self.state.document.settings.\
                                input_encoding_error_handler))
-            csv_data = csv_file.read().splitlines()
+            csv_data = self.iter_lines(csv_file.read())
         else:
             error = self.state_machine.reporter.warning(
                 'The "%s" directive requires content; none supplied.'
@@ -321,6 +339,82 @@ class CSVTable(Table):
     decode_from_csv = staticmethod(decode_from_csv)
     encode_for_csv = staticmethod(encode_for_csv)
 
+    def iter_lines(text, chunk_size=1 << 16):
+        """
+        Return an iterator over the lines of `text`, like
+        ``text.splitlines()`` but without creating the complete list.
+        """
+        start = 0
+        while start < len(text):
+            stop = text.find('\n', start + chunk_size) + 1 or len(text)
+            for line in text[start:stop].splitlines():
+                yield line
+            start = stop
+    iter_lines = staticmethod(iter_lines)
+
+    def read_csv_rows(self, csv_data, dialect):
+        """
+        Read the rows of `csv_data` (an iterable of lines) as lists of cell
+        texts.  Return the rows and the maximum number of cells in a row.
+        """
+        encode = self.encode_for_csv
+        decode = self.decode_from_csv
+        def encoded_lines():
+            # csv.py doesn't do Unicode; encode temporarily as UTF-8
+            for line in csv_data:
+                yield encode(line + '\n')
+        rows = []
+        max_cols = 0
+        for row in csv.reader(encoded_lines(), dialect=dialect):
+            # decode UTF-8 back to Unicode
+            rows.append([decode(cell) for cell in row])
+            max_cols = max(max_cols, len(row))
+        return rows, max_cols
+
+    def cell_blocks(self, row, source):
+        """Return the cell data of `row` (a list of cell texts) for
+        `states.RSTState.build_table()`."""
+        return [(0, 0, 0, statemachine.StringList(cell_text.splitlines(),
+                                                  source=source))
+                for cell_text in row]
+
+    def build_csv_row(self, row, columns, source):
+        """
+        Return a `row` node for `row` (a list of cell texts), padded with
+        empty entries to `columns` cells.
+
+        Like `states.RSTState.build_table_row()`, but cells consisting of
+        plain text are added as paragraphs directly (the result of parsing
+        them), skipping the nested parse.
+        """
+        state = self.state
+        fast = (self.plain_cell_fast_path
+                and state.inliner.__class__ is states.Inliner
+                and len(state.inliner.implicit_dispatch) == 1)
+        plain_cell = self.plain_cell_pattern.match
+        row_node = nodes.row()
+        for cell_text in row:
+            entry = nodes.entry()
+            row_node += entry
+            if (fast and plain_cell(cell_text)
+                and not state.starts_body_element(cell_text)):
+                text = cell_text.rstrip()
+                paragraph = nodes.paragraph(
+                    text, '', nodes.Text(text, rawsource=text))
+                paragraph.source, paragraph.line = source, 1
+                entry += paragraph
+                # As left by `states.RSTState.nested_paragraph()`:
+                state.document.note_source(source, None)
+                continue
+            cellblock = statemachine.StringList(cell_text.splitlines(),
+                                                source=source)
+            if ''.join(cellblock):
+                state.nested_parse(cellblock, input_offset=self.content_offset,
+                                   node=entry)
+        for i in range(columns - len(row)):
+            row_node += nodes.entry()
+        return row_node
+
     def parse_csv_data_into_rows(self, csv_data, dialect, source):
         # csv.py doesn't do Unicode; encode temporarily as UTF-8
         csv_reader = csv.reader([self.encode_for_csv(line + '\n')
@@ -133,6 +133,10 @@ class Struct:
         self.__dict__.update(keywordargs)
 
 
+state_machine_pool = statemachine.StateMachinePool()
+"""Idle state machines, shared by all parses."""
+
+
 class RSTStateMachine(StateMachineWS):
 
     """
@@ -142,12 +146,16 @@ class RSTStateMachine(StateMachineWS):
     """
 
     def run(self, input_lines, document, input_offset=0, match_titles=1,
-            inliner=None):
+            inliner=None, title_styles=None):
         """
         Parse `input_lines` and modify the `document` node in place.
 
         Extend `StateMachineWS.run()`: set up parse-global data and
         run the StateMachine.
+
+        The start of each top-level section is recorded in
+        ``document.section_blocks`` for `reparse()`.  `title_styles` seeds
+        the list of section title styles already seen.
         """
         self.language = languages.get_language(
             document.settings.language_code)
@@ -155,22 +163,268 @@ class RSTStateMachine(StateMachineWS):
         if inliner is None:
             inliner = Inliner()
         inliner.init_customizations(document.settings)
+        title_styles = list(title_styles or [])
         self.memo = Struct(document=document,
                            reporter=document.reporter,
                            language=self.language,
-                           title_styles=[],
+                           title_styles=title_styles,
                            section_level=0,
                            section_bubble_up_kludge=0,
-                           inliner=inliner)
+                           inliner=inliner,
+                           profile=self.profile,
+                           section_blocks=[Struct(
+                               node=None, line=input_offset,
+                               messages=len(document.parse_messages),
+                               title_styles=title_styles[:])])
         self.document = document
         self.attach_observer(document.note_source)
         self.reporter = self.memo.reporter
         self.node = document
+        input_length = len(input_lines)
         results = StateMachineWS.run(self, input_lines, input_offset,
                                      input_source=document['source'])
         assert results == [], 'RSTStateMachine.run() results should be empty!'
+        if len(self.input_lines) == input_length:
+            document.section_blocks = self.memo.section_blocks
+        else:
+            # Input was inserted (e.g. by the "include" directive); line
+            # numbers no longer map to the source, so no re-parsing.
+            document.section_blocks = None
+        self.final_title_styles = self.memo.title_styles
         self.node = self.memo = None    # remove unneeded references
 
+    def reparse(self, input_lines, document, start, old_stop, new_stop,
+                inliner=None):
+        """
+        Re-parse the top-level sections of `document` touched by an edit,
+        and splice the result into `document` in place.  Return true on
+        success, false if `document` has to be parsed from scratch.
+
+        Lines ``start:old_stop`` of the input `document` was parsed from
+        have been replaced by lines ``start:new_stop`` of `input_lines`
+        (the complete new input, a `StringList`).  The enclosing top-level
+        sections are re-parsed, extended to their neighbours where the
+        edit could affect them (e.g. a changed section title).  Line
+        numbers of the nodes after the edit are adjusted.
+
+        Only documents that were just parsed (no transforms applied yet)
+        and do not include other files can be re-parsed.  Auto-generated
+        IDs of the new nodes may differ from those of a full parse.
+        """
+        blocks = getattr(document, 'section_blocks', None)
+        if (not blocks or document.transformer.applied
+            or document.decoration is not None):
+            return 0
+        delta = new_stop - old_stop
+        first = self.find_section_block(blocks, start - 1)
+        last = self.find_section_block(blocks, old_stop)
+        while 1:
+            region_start = blocks[first].line
+            if last + 1 < len(blocks):
+                region_stop = blocks[last + 1].line + delta
+                if input_lines[region_stop - 1].strip():
+                    # the following title could be affected
+                    last += 1
+                    continue
+            else:
+                region_stop = len(input_lines)
+            subdocument = nodes.document(document.settings, document.reporter,
+                                         source=document['source'])
+            subdocument.id_start = document.id_start
+            document.reporter.locator = self.get_source_and_line
+            document.reporter.attach_observer(subdocument.note_parse_message)
+            try:
+                self.run(input_lines[region_start:region_stop], subdocument,
+                         input_offset=region_start, inliner=inliner,
+                         title_styles=blocks[first].title_styles)
+            finally:
+                document.reporter.detach_observer(
+                    subdocument.note_parse_message)
+            subblocks = subdocument.section_blocks
+            if subblocks is None:
+                return 0
+            if first and (len(subblocks) < 2 or len(subdocument) == 0
+                          or subblocks[1].node is not subdocument[0]):
+                # the preceding section swallows the start of the region
+                first -= 1
+                continue
+            break
+        if last + 1 < len(blocks):
+            styles = blocks[last + 1].title_styles
+            if not (self.final_title_styles == styles
+                    or (not self.final_title_styles and len(styles) == 1)):
+                return 0
+        return self.splice_section_blocks(document, subdocument, first, last,
+                                          delta)
+
+    def find_section_block(self, blocks, line):
+        """Return the index of the section block containing `line`."""
+        index = 0
+        for i in range(1, len(blocks)):
+            if blocks[i].line > line:
+                break
+            index = i
+        return index
+
+    def splice_section_blocks(self, document, subdocument, first, last,
+                              delta):
+        """
+        Replace section blocks `first` to `last` of `document` with the
+        contents of `subdocument` and update the `document` indexes.
+        Return false if this is impossible (duplicate names or IDs).
+        """
+        blocks = document.section_blocks
+        if blocks[first].node is None:
+            begin = 0
+        else:
+            begin = document.index(blocks[first].node)
+        if last + 1 < len(blocks):
+            end = document.index(blocks[last + 1].node)
+            msgend = blocks[last + 1].messages
+        else:
+            end = len(document)
+            msgend = len(document.parse_messages)
+        msgbegin = blocks[first].messages
+        old = {}
+        for child in document[begin:end]:
+            for node in child.traverse(nodes.Element):
+                old[node] = 1
+        kept_names = {}
+        for child in document[:begin] + document[end:]:
+            for node in child.traverse(nodes.Element):
+                for name in node['names'] + node['dupnames']:
+                    kept_names[name] = 1
+        old_names = {}
+        for node in old.keys():
+            for name in node['names'] + node['dupnames']:
+                if name in kept_names:
+                    return 0
+                old_names[name] = 1
+        new = subdocument.traverse(nodes.Element, include_self=0)
+        for node in new:
+            for name in node['names'] + node['dupnames']:
+                if name in kept_names:
+                    return 0
+        for id, node in subdocument.ids.items():
+            if id in document.ids and document.ids[id] not in old:
+                return 0
+        for name, node in subdocument.substitution_defs.items():
+            if (name in document.substitution_defs
+                and document.substitution_defs[name] not in old):
+                return 0
+        if subdocument.decoration is not None:
+            return 0
+        # Parse messages: drop those of the old region, insert the new ones.
+        messages = document.parse_messages
+        removed = 0
+        kept_before = []
+        kept_after = []
+        for i in range(len(messages)):
+            msg = messages[i]
+            if msg in old or (msgbegin <= i < msgend and msg.parent is None):
+                removed += 1
+            elif i < msgbegin:
+                kept_before.append(msg)
+            else:
+                if i >= msgend and msg.parent is None:
+                    self.shift_line(msg, delta)
+                kept_after.append(msg)
+        document.parse_messages = (kept_before + subdocument.parse_messages
+                                   + kept_after)
+        # Adjust line numbers and swap the children.
+        for child in document[end:]:
+            for node in child.traverse(nodes.Element):
+                self.shift_line(node, delta)
+        for node in new:
+            node.document = document
+        document[begin:end] = subdocument.children
+        # Update the indexes.
+        for name in old_names.keys():
+            if name in document.nameids:
+                del document.nameids[name]
+            if name in document.nametypes:
+                del document.nametypes[name]
+        document.nameids.update(subdocument.nameids)
+        document.nametypes.update(subdocument.nametypes)
+        for id, node in document.ids.items():
+            if node in old:
+                del document.ids[id]
+        document.ids.update(subdocument.ids)
+        for name, node in document.substitution_defs.items():
+            if node in old:
+                del document.substitution_defs[name]
+        document.substitution_defs.update(subdocument.substitution_defs)
+        for key, name in document.substitution_names.items():
+            if name not in document.substitution_defs:
+                del document.substitution_names[key]
+        document.substitution_names.update(subdocument.substitution_names)
+        order = {}
+        for node in document.traverse(nodes.Element):
+            order[node] = len(order)
+        for attname in self.document_lists:
+            setattr(document, attname, self.merge_index_list(
+                getattr(document, attname), getattr(subdocument, attname),
+                old, order))
+        for attname in self.document_list_maps:
+            mapping = getattr(document, attname)
+            submapping = getattr(subdocument, attname)
+            keys = mapping.copy()
+            keys.update(submapping)
+            for key in keys.keys():
+                merged = self.merge_index_list(
+                    mapping.get(key, []), submapping.get(key, []), old, order)
+                if merged:
+                    mapping[key] = merged
+                elif key in mapping:
+                    del mapping[key]
+        document.id_start = subdocument.id_start
+        transformer = document.transformer
+        transformer.transforms = [t for t in transformer.transforms
+                                  if t[2] not in old]
+        for priority_string, transform_class, pending, kwargs \
+                in subdocument.transformer.transforms:
+            priority = int(priority_string.split('-')[0])
+            transformer.transforms.append(
+                (transformer.get_priority_string(priority),
+                 transform_class, pending, kwargs))
+            transformer.sorted = 0
+        # Update the section block records.
+        subblocks = subdocument.section_blocks
+        if first:
+            subblocks = subblocks[1:]
+        for block in subblocks:
+            block.messages += len(kept_before)
+        for block in blocks[last + 1:]:
+            block.line += delta
+            block.messages += len(subdocument.parse_messages) - removed
+        blocks[first:last + 1] = subblocks
+        return 1
+
+    document_lists = ('autofootnotes', 'autofootnote_refs',
+                      'symbol_footnotes', 'symbol_footnote_refs',
+                      'footnotes', 'citations', 'indirect_targets')
+    """`nodes.document` attributes holding lists of nodes."""
+
+    document_list_maps = ('refnames', 'refids', 'footnote_refs',
+                          'citation_refs')
+    """`nodes.document` attributes mapping keys to lists of nodes."""
+
+    def merge_index_list(self, nodelist, newnodes, old, order):
+        """Merge two index lists, dropping `old` nodes; keep document order."""
+        end = len(order)
+        decorated = []
+        for node in nodelist + newnodes:
+            if node not in old:
+                decorated.append((order.get(node, end), len(decorated), node))
+        decorated.sort()
+        return [node for position, i, node in decorated]
+
+    def shift_line(self, node, delta):
+        if node.line is not None:
+            node.line += delta
+        if isinstance(node, nodes.system_message) and node.get('line'):
+            node['line'] += delta
+
 
 class NestedStateMachine(StateMachineWS):
 
@@ -187,6 +441,7 @@ class NestedStateMachine(StateMachineWS):
         """
         self.match_titles = match_titles
         self.memo = memo
+        self.profile = getattr(memo, 'profile', None)
         self.document = memo.document
         self.attach_observer(self.document.note_source)
         self.reporter = memo.reporter
@@ -207,7 +462,13 @@ class RSTState(StateWS):
     """
 
     nested_sm = NestedStateMachine
-    nested_sm_cache = []
+
+    nested_paragraph_fast_path = 1
+    """Let `nested_parse()` handle plain single paragraphs directly?"""
+
+    paragraph_start_exclusions = None
+    """Compiled `Body` patterns of lines which can't start a plain paragraph
+    (built on first use)."""
 
     def __init__(self, state_machine, debug=0):
         self.nested_sm_kwargs = {'state_classes': state_classes,
@@ -262,37 +523,104 @@ class RSTState(StateWS):
         Create a new StateMachine rooted at `node` and run it over the input
         `block`.
         """
-        use_default = 0
         if state_machine_class is None:
             state_machine_class = self.nested_sm
-            use_default += 1
         if state_machine_kwargs is None:
             state_machine_kwargs = self.nested_sm_kwargs
-            use_default += 1
         block_length = len(block)
-
-        state_machine = None
-        if use_default == 2:
-            try:
-                state_machine = self.nested_sm_cache.pop()
-            except IndexError:
-                pass
-        if not state_machine:
-            state_machine = state_machine_class(debug=self.debug,
-                                                **state_machine_kwargs)
+        if (self.nested_paragraph_fast_path and not self.debug
+            and state_machine_class is NestedStateMachine
+            and state_machine_kwargs.get('state_classes') is state_classes
+            and state_machine_kwargs.get('initial_state') == 'Body'
+            and len(state_machine_kwargs) == 2):
+            new_offset = self.nested_paragraph(block, input_offset, node)
+            if new_offset is not None:
+                return new_offset
+        state_machine = state_machine_pool.get(
+            state_machine_class, debug=self.debug, **state_machine_kwargs)
         state_machine.run(block, input_offset, memo=self.memo,
                           node=node, match_titles=match_titles)
-        if use_default == 2:
-            self.nested_sm_cache.append(state_machine)
-        else:
-            state_machine.unlink()
         new_offset = state_machine.abs_line_offset()
+        state_machine_pool.put(state_machine)
         # No `block.parent` implies disconnected -- lines aren't in sync:
         if block.parent and (len(block) - block_length) != 0:
             # Adjustment for block if modified in nested parse:
             self.state_machine.next_line(len(block) - block_length)
         return new_offset
 
+    def nested_paragraph(self, block, input_offset, node):
+        """
+        Fast path of `nested_parse()` for a `block` consisting of a plain
+        paragraph, optionally surrounded by blank lines (e.g. most table
+        cells and list items).
+
+        Add the paragraph to `node` exactly as a nested state machine would,
+        and return the new line offset.  Return None (doing nothing) if the
+        block holds anything else: markup starting a body element, indented
+        lines, a title or transition, or a literal block marker.
+        """
+        if not isinstance(block, statemachine.StringList):
+            return None
+        lines = block.data
+        end = len(lines)
+        start = 0
+        while start < end and not lines[start].strip():
+            if lines[start].strip(' '):
+                return None
+            start += 1
+        if start == end:
+            return None
+        stop = start + 1
+        while stop < end and lines[stop].strip():
+            if lines[stop][0] == ' ':
+                return None
+            stop += 1
+        for line in lines[stop:]:
+            if line.strip(' '):
+                return None
+        first = lines[start]
+        if first[0] == ' ' or self.starts_body_element(first):
+            return None
+        if stop - start > 1:
+            # The second line must not be a title underline:
+            if re.match(Text.patterns['underline'], lines[start + 1]):
+                return None
+            current = stop - 1
+        else:
+            current = stop
+        data = '\n'.join(lines[start:stop]).rstrip()
+        if data.endswith('::'):
+            return None
+        # Same source tracking as the state machine: the current line when
+        # the paragraph is parsed, then "just past the end".
+        self.document.note_source(*block.info(current))
+        lineno = input_offset + start + 1
+        textnodes, messages = self.inliner.parse(data, lineno, self.memo,
+                                                 node)
+        p = nodes.paragraph(data, '', *textnodes)
+        src, srcoffset = block.info(start)
+        p.source, p.line = src, srcoffset + 1
+        node += p
+        node += messages
+        self.document.note_source(*block.info(end))
+        return input_offset + end
+
+    def starts_body_element(self, line):
+        """
+        Return true if `line` starts a body element other than a paragraph
+        (a list, table, explicit markup, transition, etc.).
+        """
+        patterns = self.paragraph_start_exclusions
+        if patterns is None:
+            patterns = [re.compile(Body.patterns[name])
+                        for name in Body.initial_transitions
+                        if name != 'text']
+            RSTState.paragraph_start_exclusions = patterns
+        for pattern in patterns:
+            if pattern.match(line):
+                return 1
+        return 0
+
     def nested_list_parse(self, block, input_offset, node, initial_state,
                           blank_finish,
                           blank_finish_state=None,
@@ -310,8 +638,8 @@ class RSTState(StateWS):
         if state_machine_kwargs is None:
             state_machine_kwargs = self.nested_sm_kwargs.copy()
         state_machine_kwargs['initial_state'] = initial_state
-        state_machine = state_machine_class(debug=self.debug,
-                                            **state_machine_kwargs)
+        state_machine = state_machine_pool.get(
+            state_machine_class, debug=self.debug, **state_machine_kwargs)
         if blank_finish_state is None:
             blank_finish_state = initial_state
         state_machine.states[blank_finish_state].blank_finish = blank_finish
@@ -320,8 +648,9 @@ class RSTState(StateWS):
         state_machine.run(block, input_offset, memo=self.memo,
                           node=node, match_titles=match_titles)
         blank_finish = state_machine.states[blank_finish_state].blank_finish
-        state_machine.unlink()
-        return state_machine.abs_line_offset(), blank_finish
+        new_offset = state_machine.abs_line_offset()
+        state_machine_pool.put(state_machine)
+        return new_offset, blank_finish
 
     def section(self, title, source, style, lineno, messages):
         """Check for a valid subsection and create one if it checks out."""
@@ -391,6 +720,12 @@ class RSTState(StateWS):
         section_node += messages
         section_node += title_messages
         self.document.note_implicit_target(section_node, section_node)
+        if mylevel == 0 and self.parent is self.document:
+            style = memo.title_styles[0]
+            memo.section_blocks.append(Struct(
+                node=section_node, line=lineno - len(style),
+                messages=len(self.document.parse_messages),
+                title_styles=memo.title_styles[:]))
         offset = self.state_machine.line_offset + 1
         absoffset = self.state_machine.abs_line_offset() + 1
         newabsoffset = self.nested_parse(
@@ -471,14 +806,25 @@ class Inliner:
         """List of (pattern, bound method) tuples, used by
         `self.implicit_inline`."""
 
+        self.profile = None
+        """`docutils.statemachine.Profile` timing interpreted text roles,
+        or None."""
+
     def init_customizations(self, settings):
-        """Setting-based customizations; run when parsing begins."""
-        if settings.pep_references:
-            self.implicit_dispatch.append((self.patterns.pep,
-                                           self.pep_reference))
-        if settings.rfc_references:
-            self.implicit_dispatch.append((self.patterns.rfc,
-                                           self.rfc_reference))
+        """
+        Setting-based customizations; run when parsing begins.
+
+        An `Inliner` may be reused for many parses (see
+        `docutils.parsers.rst.Parser`), so entries are only added once.
+        """
+        for setting, pattern, method in (
+            (settings.pep_references, self.patterns.pep, self.pep_reference),
+            (settings.rfc_references, self.patterns.rfc, self.rfc_reference)):
+            entry = (pattern, method)
+            if setting and entry not in self.implicit_dispatch:
+                self.implicit_dispatch.append(entry)
+            elif not setting and entry in self.implicit_dispatch:
+                self.implicit_dispatch.remove(entry)
 
     def parse(self, text, lineno, memo, parent):
         # Needs to be refactored for nested inline markup.
@@ -499,6 +845,7 @@ class Inliner:
         self.reporter = memo.reporter
         self.document = memo.document
         self.language = memo.language
+        self.profile = getattr(memo, 'profile', None)
         self.parent = parent
         pattern_search = self.patterns.initial.search
         dispatch = self.dispatch
@@ -828,6 +1175,11 @@ class Inliner:
         role_fn, messages = roles.role(role, self.language, lineno,
                                        self.reporter)
         if role_fn:
+            if self.profile is not None:
+                nodes, messages2 = self.profile.call(
+                    ('role', role.lower() or '(default)'),
+                    role_fn, role, rawsource, text, lineno, self)
+                return nodes, messages + messages2
             nodes, messages2 = role_fn(role, rawsource, text, lineno, self)
             return nodes, messages + messages2
         else:
@@ -1999,7 +2351,7 @@ class Body(RSTState):
                 del substitution_node[i]
             else:
                 i += 1
-        for node in substitution_node.traverse(nodes.Element):
+        for node in substitution_node.iter_traverse(nodes.Element):
             if self.disallowed_inside_substitution_definitions(node):
                 pformat = nodes.literal_block('', node.pformat().rstrip())
                 msg = self.reporter.error(
@@ -2084,7 +2436,12 @@ class Body(RSTState):
             type_name, arguments, options, content, lineno,
             content_offset, block_text, self, self.state_machine)
         try:
-            result = directive_instance.run()
+            if self.state_machine.profile is not None:
+                result = self.state_machine.profile.call(
+                    ('directive', type_name.lower()),
+                    directive_instance.run)
+            else:
+                result = directive_instance.run()
         except docutils.parsers.rst.DirectiveError, error:
             msg_node = self.reporter.system_message(error.level, error.msg,
                 source=src, line=srcline)
@@ -4,7 +4,7 @@
 
 """Reader for existing document trees."""
 
-from docutils import readers, utils, transforms
+from docutils import readers, utils, transforms, serial
 
 
 class Reader(readers.ReReader):
@@ -19,6 +19,8 @@ class Reader(readers.ReReader):
         pub = docutils.core.Publisher(
             ..., source=docutils.io.DocTreeInput(document), ...)
 
+    A document tree serialized by `docutils.serial` is loaded first.
+
     The original document settings are overridden; if you want to use the
     settings of the original document, pass ``settings=document.settings`` to
     the Publisher call above.
@@ -34,6 +36,8 @@ class Reader(readers.ReReader):
         No parsing to do; refurbish the document tree instead.
         Overrides the inherited method.
         """
+        if serial.is_serialized(self.input):
+            self.input = serial.loads(self.input)
         self.document = self.input
         # Create fresh Transformer object, to be populated from Writer
         # component.
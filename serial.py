@@ -0,0 +1,676 @@
+# $Id$
+# Copyright: This module has been placed in the public domain.
+
+"""
+Compact binary serialization of document trees.
+
+`dumps()` turns a `nodes.document` into a byte string, `loads()` turns it
+back into an equivalent document tree.  This is a faster and smaller
+alternative to pickling document trees, e.g. to pass them from parsing to
+writing processes.  Serialized document trees are accepted by
+`docutils.io.DocTreeInput` and the "doctree" reader.
+
+Unpickling runs Python code for every element (`nodes.Element.__setstate__`
+and a `setattr()` per instance attribute).  Loading a serialized document
+tree doesn't: `marshal` rebuilds the strings, numbers, lists and
+dictionaries in C, then the nodes are created and their slots set column
+by column, with `map()` calls.  Only the values `marshal` can't store
+(node references in instance dictionaries, tuples, etc.) are decoded one
+by one.
+
+Loading is no safer than unpickling: it imports the modules named in the
+data, and unpickles the values stored as pickles.  Only load serialized
+document trees from trusted sources.  Like `marshal` data, serialized
+document trees are meant to be loaded by the Python version which saved
+them.
+
+The data is `MAGIC`, the format `VERSION` (one byte), and a `marshal`
+serialized tuple (`marshal` interns attribute names and other 8-bit
+strings) of:
+
+1. The class table: (module name, class name) pairs.
+
+2. The value table: the distinct values of the node data columns other
+   than "attributes" and "state", and of the texts of the text nodes,
+   stored as a column (see below).
+
+3. The tree structure: the class indices of all nodes, in the order of
+   first appearance: the document first, then nodes referred to but not
+   contained in the document (e.g. targets removed from the tree but
+   still in ``document.ids``), each subtree in tree order.  Then the
+   indices + 1 of the nodes' parents (0 for the roots), the value indices
+   of the texts of the text nodes, and (parent index, position, node
+   index) triples for further occurrences of nodes as children.
+
+4. The node data of the elements and of the text nodes, in columns (see
+   `Serializer.element_columns` and `Serializer.text_columns`).  The
+   columns of node references (`Serializer.node_columns`) store node index
+   + 1 (0 for None), and (element or text node number, value index) pairs
+   for other values; the others but "attributes" and "state" store value
+   indices.
+
+Lists of numbers (class, node and value indices) are packed as
+(`array` type code, little-endian data) pairs.  The value table and the
+"attributes" column (plain dictionaries, without empty list attributes,
+which `nodes.Attributes` creates when looked up) are a list of values, and
+a list of (number, encoded value) pairs for the values `marshal` can't
+store, which are None in the list.  The "state" columns are lists of
+(element or text node number, encoded instance dictionary) pairs, for the
+nodes with other instance attributes.
+
+An encoded value (see `Serializer.encode()`) is the value itself if
+`marshal` can store it.  Tuples stand for the other values: a tag (see
+`TAGS`) followed by arguments.  Objects of unknown types are pickled.
+
+The document's indexes (``ids``, ``nameids``, ``refnames``, footnote
+lists, etc.) are values referring to nodes by index, so loading rebuilds
+them without walking the tree.  The document's ``settings``, ``reporter``,
+``transformer`` and ``node_index`` are not stored.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import sys
+import gc
+import marshal
+from array import array
+from itertools import izip, repeat
+from types import ClassType, InstanceType
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from docutils import nodes, transforms, utils
+
+
+MAGIC = '\x89DTB\r\n\x1a\n'
+"""Start of serialized document trees."""
+
+VERSION = 3
+"""Version of the serialization format (incremented on changes)."""
+
+TAGS = ('tuple', 'node', 'reprunicode', 'attributes', 'class', 'instance',
+        'pickle', 'default')
+"""Tags of encoded values, by number.  Their arguments are: the encoded
+items ('tuple'); a node index ('node'); a unicode string ('reprunicode');
+an encoded dictionary ('attributes', for `nodes.Attributes`); a class
+index ('class'); a class index and the encoded instance dictionary
+('instance', for instances of classic classes like the parser's `Struct`
+objects); a pickle ('pickle').  'default' (no arguments) stands for an
+unset slot or a missing instance attribute."""
+
+(_TUPLE, _NODE, _REPRUNICODE, _ATTRIBUTES, _CLASS, _INSTANCE, _PICKLE,
+ _DEFAULT) = range(len(TAGS))
+
+_default = object()
+"""Decoded 'default' value."""
+
+_plain_types = dict.fromkeys([type(None), bool, int, long, float, str,
+                              unicode])
+"""Types of the values stored as they are (exact types only: `marshal`
+would turn subclass instances into base class instances)."""
+
+_containers = dict.fromkeys([list, dict, tuple])
+"""Types of the encoded values which may need decoding."""
+
+_typecodes = (('B', 1 << 8), ('H', 1 << 16), ('i', 1 << 31))
+"""`array` type codes for packed numbers, with their limits."""
+
+_slot_descriptors = dict([(name, nodes.Element.__dict__[name])
+                          for name in nodes.Element.__slots__
+                          if name != '__dict__'])
+
+_excluded_document_attributes = ('settings', 'reporter', 'transformer',
+                                 'node_index')
+"""Instance attributes of the document that are not stored."""
+
+
+def is_serialized(data):
+    """Return true if the byte string `data` is a serialized document."""
+    return isinstance(data, str) and data.startswith(MAGIC)
+
+def dump(document, stream):
+    """Write the serialization of `document` to the binary file `stream`."""
+    stream.write(dumps(document))
+
+def load(stream, settings=None):
+    """
+    Read a serialized document from the binary file `stream` (see
+    `loads()`).
+    """
+    return loads(stream.read(), settings)
+
+def dumps(document):
+    """Return the serialization of `document` (a byte string)."""
+    return Serializer(document).serialize()
+
+def loads(data, settings=None):
+    """
+    Return the document tree serialized in `data`.
+
+    If runtime `settings` are given, the document gets them and a new
+    reporter; otherwise ``document.settings`` & ``document.reporter`` are
+    None (as for unpickled documents).
+
+    Raise ValueError if `data` is not a serialized document of a supported
+    format version.  Like ``pickle.loads()``, this imports the modules
+    named in `data` and unpickles values stored as pickles: don't load
+    data from untrusted sources.
+    """
+    document = Deserializer(data).deserialize()
+    document.transformer = transforms.Transformer(document)
+    if settings is not None:
+        document.settings = settings
+        document.reporter = utils.new_reporter(document.get('source', ''),
+                                               settings)
+    return document
+
+
+def _find_class(module, name):
+    """Return the class `name` of `module` (None if there is none)."""
+    try:
+        __import__(module)
+        return getattr(sys.modules[module], name, None)
+    except ImportError:
+        return None
+
+def _pack(numbers):
+    """Return the packed list of non-negative integers `numbers`."""
+    largest = max([0] + numbers)
+    for typecode, limit in _typecodes:
+        if largest < limit:
+            break
+    else:
+        raise ValueError('document too large to serialize')
+    numbers = array(typecode, numbers)
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return typecode, numbers.tostring()
+
+def _unpack(packed):
+    """Return the list of numbers packed as `packed` (an array)."""
+    typecode, data = packed
+    if typecode not in [code for code, limit in _typecodes]:
+        raise ValueError('invalid serialized document')
+    numbers = array(typecode, data)
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return numbers
+
+
+class Serializer:
+
+    """Serialize a document tree (see the module docstring)."""
+
+    element_columns = ('rawsource', 'tagname', 'parent', 'document',
+                       'source', 'line', 'attributes', 'state')
+    """Node data columns of elements: the slots, and the instance
+    dictionaries."""
+
+    text_columns = ('parent', 'rawsource', 'state')
+    """Node data columns of text nodes: the "parent" and "rawsource"
+    instance attributes, and the other instance attributes."""
+
+    node_columns = ('parent', 'document')
+    """Columns of node references."""
+
+    def __init__(self, document):
+        self.document = document
+
+        self.classes = {}
+        """Mapping of classes to their indices in the class table."""
+
+        self.class_names = []
+        """The class table: (module name, class name) pairs."""
+
+        self.values = ([], [])
+        """The value table (a column)."""
+
+        self.value_indices = {}
+        """Mapping of (type, value) to the value's index in the value
+        table, for hashable values."""
+
+        self.nodes = []
+        """All nodes, in the order of first appearance."""
+
+        self.indices = {}
+        """Mapping of ``id(node)`` to the node's index."""
+
+        self.node_classes = []
+        """Class indices of the nodes."""
+
+        self.parents = []
+        """Index + 1 of the first parent of each node (0 for roots)."""
+
+        self.texts = []
+        """Value indices of the texts of the text nodes."""
+
+        self.occurrences = []
+        """(parent, position, node) index triples of further occurrences
+        of nodes as children."""
+
+        self.elements = 0
+        """Number of elements whose data has been added."""
+
+        self.text_nodes = 0
+        """Number of text nodes whose data has been added."""
+
+        self.columns = {}
+        """Mapping of ("element" or "text", column name) to the column's
+        lists of numbers and of (number, value) pairs."""
+        for name in self.element_columns:
+            self.columns['element', name] = ([], [])
+        for name in self.text_columns:
+            self.columns['text', name] = ([], [])
+
+        self.encoded = 0
+        """Did `encode()` encode any value (since last reset)?"""
+
+    def serialize(self):
+        self.add_subtree(self.document)
+        index = 0
+        while index < len(self.nodes):  # grows with referenced subtrees
+            self.add_node_data(self.nodes[index])
+            index += 1
+        columns = {}
+        for (kind, name), (numbers, others) in self.columns.items():
+            if name not in ('attributes', 'state'):
+                numbers = _pack(numbers)
+            columns[kind, name] = (numbers, others)
+        data = (self.class_names, self.values, _pack(self.node_classes),
+                _pack(self.parents), _pack(self.texts), self.occurrences,
+                [columns['element', name] for name in self.element_columns],
+                [columns['text', name] for name in self.text_columns])
+        return MAGIC + chr(VERSION) + marshal.dumps(data)
+
+    def class_index(self, cls):
+        """Return the class table index of `cls`."""
+        try:
+            return self.classes[cls]
+        except KeyError:
+            self.class_names.append((cls.__module__, cls.__name__))
+            index = self.classes[cls] = len(self.classes)
+            return index
+
+    def value_index(self, value):
+        """Return the value table index of `value`."""
+        key = (type(value), value)
+        try:
+            return self.value_indices[key]
+        except KeyError:
+            pass
+        except TypeError:               # unhashable
+            key = None
+        values, encoded_values = self.values
+        index = len(values)
+        self.encoded = 0
+        encoded = self.encode(value)
+        if self.encoded:
+            values.append(None)
+            encoded_values.append((index, encoded))
+        else:
+            values.append(encoded)
+        if key is not None:
+            self.value_indices[key] = index
+        return index
+
+    def node_index(self, node):
+        """Return the index of `node`, adding its subtree if necessary."""
+        index = self.indices.get(id(node))
+        if index is None:
+            index = len(self.nodes)
+            self.add_subtree(node)
+        return index
+
+    def add_subtree(self, root):
+        """Add the tree structure of the subtree `root` (not yet added)."""
+        all_nodes = self.nodes
+        indices = self.indices
+        node_classes = self.node_classes
+        parents = self.parents
+        texts = self.texts
+        stack = [(0, iter(((0, root),)))]
+        while stack:
+            parent, children = stack[-1]
+            for position, node in children:
+                index = indices.get(id(node))
+                if index is not None:
+                    self.occurrences.extend((parent - 1, position, index))
+                    continue
+                index = indices[id(node)] = len(all_nodes)
+                all_nodes.append(node)
+                node_classes.append(self.class_index(node.__class__))
+                parents.append(parent)
+                if isinstance(node, nodes.Text):
+                    texts.append(self.value_index(unicode(node)))
+                else:
+                    stack.append((index + 1, enumerate(node.children)))
+                    break
+            else:
+                stack.pop()
+
+    def add_value(self, kind, name, number, value):
+        """
+        Add `value` to the column `name` of the elements or text nodes
+        (`kind`), for the element or text node `number`.
+        """
+        numbers, others = self.columns[kind, name]
+        if name not in self.node_columns:
+            numbers.append(self.value_index(value))
+        elif value is None:
+            numbers.append(0)
+        elif isinstance(value, nodes.Node):
+            numbers.append(self.node_index(value) + 1)
+        else:
+            numbers.append(0)
+            others.append((number, self.value_index(value)))
+
+    def add_node_data(self, node):
+        """Add the node data of `node`."""
+        if isinstance(node, nodes.Text):
+            state = node.__dict__.copy()
+            for name in self.text_columns[:-1]:
+                self.add_value('text', name, self.text_nodes,
+                               state.pop(name, _default))
+            if state:
+                self.columns['text', 'state'][1].append(
+                    (self.text_nodes, self.encode(state)))
+            self.text_nodes += 1
+            return
+        for name in self.element_columns[:-2]:
+            try:
+                value = _slot_descriptors[name].__get__(node, None)
+            except AttributeError:      # e.g. `tagname` as class attribute
+                value = _default
+            self.add_value('element', name, self.elements, value)
+        values, encoded_values = self.columns['element', 'attributes']
+        self.encoded = 0
+        try:
+            attributes = node.attributes
+        except AttributeError:
+            attributes = self.encode(_default)
+        else:
+            list_attributes = nodes.Element.list_attributes
+            attributes = self.encode(
+                dict([(name, value) for name, value in attributes.items()
+                      if value or name not in list_attributes]))
+        if self.encoded:
+            values.append(None)
+            encoded_values.append((self.elements, attributes))
+        else:
+            values.append(attributes)
+        state = node.__dict__
+        if node is self.document:
+            state = state.copy()
+            for name in _excluded_document_attributes:
+                state.pop(name, None)
+        if state:
+            self.columns['element', 'state'][1].append(
+                (self.elements, self.encode(state)))
+        self.elements += 1
+
+    def encode(self, value):
+        """
+        Return the encoding of `value`; set `self.encoded` if it isn't
+        `value` itself (or a list or dictionary of values stored as they
+        are).
+        """
+        value_type = type(value)
+        if value_type in _plain_types:
+            return value
+        elif value_type is list:
+            return [self.encode(item) for item in value]
+        elif value_type is dict:
+            encoded = {}
+            for key, item in value.items():
+                encoded[self.encode(key)] = self.encode(item)
+            return encoded
+        self.encoded = 1
+        if isinstance(value, nodes.Node):
+            return (_NODE, self.node_index(value))
+        elif value_type is tuple:
+            return (_TUPLE,) + tuple([self.encode(item) for item in value])
+        elif value_type is nodes.reprunicode:
+            return (_REPRUNICODE, unicode(value))
+        elif value_type is nodes.Attributes:
+            return (_ATTRIBUTES, self.encode(dict(value)))
+        elif value is _default:
+            return (_DEFAULT,)
+        elif (isinstance(value, (type, ClassType))
+              and _find_class(value.__module__, value.__name__) is value):
+            return (_CLASS, self.class_index(value))
+        elif (value_type is InstanceType
+              and not hasattr(value, '__getstate__')
+              and _find_class(value.__class__.__module__,
+                              value.__class__.__name__) is value.__class__):
+            return (_INSTANCE, self.class_index(value.__class__),
+                    self.encode(value.__dict__))
+        else:
+            return (_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+class Deserializer:
+
+    """Rebuild a serialized document tree (see the module docstring)."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def deserialize(self):
+        # The new nodes are not garbage, but would trigger several
+        # collections:
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.build_document()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def build_document(self):
+        data = self.data
+        if not is_serialized(data):
+            raise ValueError('not a serialized document tree')
+        if len(data) <= len(MAGIC):
+            raise ValueError('truncated serialized document')
+        version = ord(data[len(MAGIC)])
+        if version != VERSION:
+            raise ValueError('unsupported serialized document version %s '
+                             '(supported: %s)' % (version, VERSION))
+        try:
+            (class_names, values, node_classes, parents, texts, occurrences,
+             element_columns, text_columns) = marshal.loads(
+                data[len(MAGIC) + 1:])
+        except EOFError:
+            raise ValueError('truncated serialized document')
+        except (ValueError, TypeError, MemoryError):
+            raise ValueError('invalid serialized document')
+        try:
+            classes = self.classes = []
+            for module, name in class_names:
+                cls = _find_class(module, name)
+                if cls is None:
+                    raise ValueError('unknown class in serialized document: '
+                                     '%s.%s' % (module, name))
+                classes.append(cls)
+            self.build_structure(_unpack(node_classes), _unpack(parents),
+                                 _unpack(texts), occurrences, values)
+            self.set_element_data(element_columns)
+            self.set_text_data(text_columns)
+        except (IndexError, KeyError, TypeError, AttributeError):
+            raise ValueError('invalid serialized document')
+        document = self.nodes[0]
+        for name in _excluded_document_attributes:
+            if name not in document.__dict__:
+                setattr(document, name, None)
+        return document
+
+    def build_structure(self, node_classes, parents, texts, occurrences,
+                        values):
+        """
+        Create the nodes (without data) and their lists of children, and
+        decode the value table.
+        """
+        classes = self.classes
+        count = len(node_classes)
+        if len(parents) != count:
+            raise ValueError('invalid serialized document')
+        kinds = map([issubclass(cls, nodes.Text) for cls in classes]
+                    .__getitem__, node_classes)
+        element_indices = [index for index, is_text in enumerate(kinds)
+                           if not is_text]
+        text_indices = [index for index, is_text in enumerate(kinds)
+                        if is_text]
+        node_classes = map(classes.__getitem__, node_classes)
+        element_classes = map(node_classes.__getitem__, element_indices)
+        text_classes = map(node_classes.__getitem__, text_indices)
+        if len(text_classes) != len(texts):
+            raise ValueError('invalid serialized document')
+        element_children = [[] for cls in element_classes]
+        elements = self.elements = map(object.__new__, element_classes)
+        map(_slot_descriptors['children'].__set__, elements,
+            element_children)
+        # The values are plain; any encoded values (e.g. node references)
+        # are decoded once all nodes exist:
+        values, encoded_values = values
+        texts = map(values.__getitem__, texts)
+        for cls in dict.fromkeys(text_classes):
+            if cls.__new__ is not nodes.Text.__new__:
+                text_nodes = [cls.__new__(cls, text) for cls, text
+                              in izip(text_classes, texts)]
+                break
+        else:
+            text_nodes = map(unicode.__new__, text_classes, texts)
+        self.text_nodes = text_nodes
+        all_nodes = self.nodes = [None] * count
+        map(all_nodes.__setitem__, element_indices, elements)
+        map(all_nodes.__setitem__, text_indices, text_nodes)
+        # Node references are stored as node index + 1 (0 for None):
+        self.node_references = [None] + all_nodes
+        # Append each node to the children of its parent (index + 1 in
+        # `parents`, 0 for the roots):
+        children = [[]] + [None] * count
+        map(children.__setitem__, [index + 1 for index in element_indices],
+            element_children)
+        map(list.append, map(children.__getitem__, parents), all_nodes)
+        for parent, position, index in zip(occurrences[::3],
+                                           occurrences[1::3],
+                                           occurrences[2::3]):
+            children[parent + 1].insert(position, all_nodes[index])
+        self.values = self.read_values(values, encoded_values)
+        self.defaults = _default in values
+
+    def read_values(self, values, encoded_values):
+        """
+        Return the list of `values`, with the `encoded_values` (number,
+        encoded value) pairs decoded in place.
+        """
+        for number, value in encoded_values:
+            values[number] = self.decode(value)
+        return values
+
+    def read_column(self, column, count, node_column=0):
+        """Return the `count` values of a node data `column`."""
+        numbers, others = column
+        numbers = _unpack(numbers)
+        if len(numbers) != count:
+            raise ValueError('invalid serialized document')
+        if not node_column:
+            return map(self.values.__getitem__, numbers)
+        values = map(self.node_references.__getitem__, numbers)
+        for number, index in others:
+            values[number] = self.values[index]
+        return values
+
+    def set_element_data(self, columns):
+        """Set the slots and instance dictionaries of the elements."""
+        elements = self.elements
+        names = Serializer.element_columns
+        if len(columns) != len(names):
+            raise ValueError('invalid serialized document')
+        for name, column in zip(names[:-2], columns[:-2]):
+            values = self.read_column(column, len(elements),
+                                      name in Serializer.node_columns)
+            self.set_slots(name, values)
+        values, encoded_values = columns[-2]
+        if len(values) != len(elements):
+            raise ValueError('invalid serialized document')
+        if encoded_values:
+            values = self.read_values(values, encoded_values)
+            values = [(value is _default and [value]
+                       or [nodes.Attributes(value)])[0] for value in values]
+        else:
+            values = map(nodes.Attributes, values)
+        self.set_slots('attributes', values)
+        for number, state in columns[-1][1]:
+            elements[number].__dict__ = self.decode(state)
+
+    def set_slots(self, name, values):
+        """Set the slot `name` of the elements to `values`."""
+        set_slot = _slot_descriptors[name].__set__
+        if self.defaults and _default in values:
+            for element, value in izip(self.elements, values):
+                if value is not _default:
+                    set_slot(element, value)
+        else:
+            map(set_slot, self.elements, values)
+
+    def set_text_data(self, columns):
+        """Set the instance dictionaries of the text nodes."""
+        text_nodes = self.text_nodes
+        count = len(text_nodes)
+        if len(columns) != len(Serializer.text_columns):
+            raise ValueError('invalid serialized document')
+        parents = self.read_column(columns[0], count, 1)
+        rawsources = self.read_column(columns[1], count)
+        if self.defaults and (_default in parents or _default in rawsources):
+            for node, parent, rawsource in izip(text_nodes, parents,
+                                                rawsources):
+                state = node.__dict__
+                if parent is not _default:
+                    state['parent'] = parent
+                if rawsource is not _default:
+                    state['rawsource'] = rawsource
+        else:
+            map(setattr, text_nodes, repeat('__dict__', count),
+                [{'parent': parent, 'rawsource': rawsource}
+                 for parent, rawsource in izip(parents, rawsources)])
+        for number, state in columns[-1][1]:
+            text_nodes[number].__dict__.update(self.decode(state))
+
+    def decode(self, value):
+        """Return the value encoded as `value`."""
+        value_type = type(value)
+        if value_type is list:
+            return map(self.decode, value)
+        elif value_type is dict:
+            decode = self.decode
+            decoded = {}
+            for key, item in value.items():
+                if type(key) is tuple:
+                    key = decode(key)
+                if type(item) in _containers:
+                    item = decode(item)
+                decoded[key] = item
+            return decoded
+        elif value_type is not tuple:
+            return value
+        tag = value[0]
+        if tag == _NODE:
+            return self.nodes[value[1]]
+        elif tag == _TUPLE:
+            return tuple(map(self.decode, value[1:]))
+        elif tag == _REPRUNICODE:
+            return nodes.reprunicode(value[1])
+        elif tag == _ATTRIBUTES:
+            return nodes.Attributes(self.decode(value[1]))
+        elif tag == _CLASS:
+            return self.classes[value[1]]
+        elif tag == _INSTANCE:
+            return InstanceType(self.classes[value[1]], self.decode(value[2]))
+        elif tag == _PICKLE:
+            return pickle.loads(value[1])
+        elif tag == _DEFAULT:
+            return _default
+        raise ValueError('invalid value in serialized document: %r'
+                         % (value,))
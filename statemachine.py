@@ -12,6 +12,8 @@ this module defines the following classes:
 - `StateWS`, a state superclass for use with `StateMachineWS`
 - `SearchStateMachine`, uses `re.search()` instead of `re.match()`
 - `SearchStateMachineWS`, uses `re.search()` instead of `re.match()`
+- `StateMachinePool`, keeps state machines for reuse
+- `Profile`, accumulates call counts & times of transitions and the like
 - `ViewList`, extends standard Python lists.
 - `StringList`, string-specific ViewList.
 
@@ -107,7 +109,12 @@ How To Use This Module
 __docformat__ = 'restructuredtext'
 
 import sys
+import time
 import re
+import bisect
+from copy import copy
+import sre_parse
+import sre_constants
 import types
 import unicodedata
 
@@ -153,6 +160,9 @@ class StateMachine:
         self.debug = debug
         """Debugging mode on/off."""
 
+        self.profile = None
+        """A `Profile` object to time transition methods in, or None."""
+
         self.initial_state = initial_state
         """The name of the initial state (key to `self.states`)."""
 
@@ -437,12 +447,17 @@ class StateMachine:
         """
         if transitions is None:
             transitions =  state.transition_order
+            # Only try the transitions that can match the first character:
+            dispatch, default = state.get_transition_dispatch()
+            candidates = dispatch.get(self.line[:1], default)
+        else:
+            candidates = transitions
         state_correction = None
         if self.debug:
             print >>sys.stderr, (
                   '\nStateMachine.check_line: state="%s", transitions=%r.'
                   % (state.__class__.__name__, transitions))
-        for name in transitions:
+        for name in candidates:
             pattern, method, next_state = state.transitions[name]
             match = pattern.match(self.line)
             if match:
@@ -451,12 +466,21 @@ class StateMachine:
                           '\nStateMachine.check_line: Matched transition '
                           '"%s" in state "%s".'
                           % (name, state.__class__.__name__))
+                if self.profile is not None:
+                    return self.profile.call(
+                        ('transition', '%s.%s' % (state.__class__.__name__,
+                                                  name)),
+                        method, match, context, next_state)
                 return method(match, context, next_state)
         else:
             if self.debug:
                 print >>sys.stderr, (
                       '\nStateMachine.check_line: No match in state "%s".'
                       % state.__class__.__name__)
+            if self.profile is not None:
+                return self.profile.call(
+                    ('transition', '%s.no_match' % state.__class__.__name__),
+                    state.no_match, context, transitions)
             return state.no_match(context, transitions)
 
     def add_state(self, state_class):
@@ -611,6 +635,15 @@ class State:
         or other classes.
         """
 
+        self.transition_dispatch = None
+        """
+        A 2-tuple: a mapping of first characters of input lines to the lists
+        of transition names to try for them (in `self.transition_order`),
+        and the list to try for other lines.  Built by
+        `get_transition_dispatch()`, reset when transitions are added or
+        removed.
+        """
+
         self.add_initial_transitions()
 
         self.state_machine = state_machine
@@ -661,6 +694,7 @@ class State:
                 raise UnknownTransitionError(name)
         self.transition_order[:0] = names
         self.transitions.update(transitions)
+        self.transition_dispatch = None
 
     def add_transition(self, name, transition):
         """
@@ -674,6 +708,7 @@ class State:
             raise DuplicateTransitionError(name)
         self.transition_order[:0] = [name]
         self.transitions[name] = transition
+        self.transition_dispatch = None
 
     def remove_transition(self, name):
         """
@@ -686,6 +721,45 @@ class State:
             self.transition_order.remove(name)
         except:
             raise UnknownTransitionError(name)
+        self.transition_dispatch = None
+
+    def get_transition_dispatch(self):
+        """
+        Return `self.transition_dispatch`, building it if necessary.
+
+        The first characters a transition pattern can match are determined
+        from the pattern; a transition whose pattern may match anything (or
+        an empty string) is tried for every line.  The order of
+        `self.transition_order` is kept, so the first matching transition
+        is the same as when trying all of them.
+        """
+        if self.transition_dispatch is None:
+            key = []
+            for name in self.transition_order:
+                pattern = self.transitions[name][0]
+                key.append((name, pattern.pattern, pattern.flags))
+            key = tuple(key)
+            if key not in _transition_dispatch_cache:
+                _transition_dispatch_cache[key] = self.make_transition_dispatch()
+            self.transition_dispatch = _transition_dispatch_cache[key]
+        return self.transition_dispatch
+
+    def make_transition_dispatch(self):
+        """Build & return a `self.transition_dispatch` 2-tuple."""
+        first = {}
+        for name in self.transition_order:
+            first[name] = _first_characters(self.transitions[name][0])
+        default = [name for name in self.transition_order
+                   if first[name] is None]
+        characters = {}
+        for chars in first.values():
+            if chars is not None:
+                characters.update(chars)
+        dispatch = {}
+        for char in characters.keys():
+            dispatch[char] = [name for name in self.transition_order
+                              if first[name] is None or char in first[name]]
+        return dispatch, default
 
     def make_transition(self, name, next_state=None):
         """
@@ -727,6 +801,39 @@ class State:
         Parameter `name_list`: a list, where each entry is either a transition
         name string, or a 1- or 2-tuple (transition name, optional next state
         name).
+
+        Unless `make_transition()` is overridden, the compiled patterns and
+        next states are shared by all instances of a `State` subclass
+        (registered in `_transition_table_cache` per class, `name_list` and
+        `self.patterns` object); only the transition methods are looked up
+        for each instance.
+        """
+        if self.__class__.make_transition == State.make_transition:
+            try:
+                key = (self.__class__, tuple(name_list))
+                patterns, names, table = _transition_table_cache[key]
+            except KeyError:
+                patterns = None
+            except TypeError:           # unhashable `name_list` entries
+                key = patterns = None
+            if patterns is None or patterns is not self.patterns:
+                names, transitions = self.make_transitions_uncached(name_list)
+                if key is not None:
+                    table = [(name, transitions[name][0], transitions[name][2])
+                             for name in names]
+                    _transition_table_cache[key] = (self.patterns, names,
+                                                    table)
+                return names, transitions
+            transitions = {}
+            for name, pattern, next_state in table:
+                transitions[name] = (pattern, getattr(self, name), next_state)
+            return names[:], transitions
+        return self.make_transitions_uncached(name_list)
+
+    def make_transitions_uncached(self, name_list):
+        """
+        Return a list of transition names and a transition mapping, calling
+        `make_transition()` for every entry of `name_list`.
         """
         stringtype = type('')
         names = []
@@ -1064,6 +1171,222 @@ class SearchStateMachineWS(_SearchOverride, StateMachineWS):
     pass
 
 
+class LineLocator:
+
+    """
+    The `StateMachine.get_source_and_line()` lookup of a state machine,
+    frozen at the end of its run.
+
+    A `docutils.utils.Reporter` keeps using its ``locator`` after parsing
+    (for messages of transforms).  Bind it to a `LineLocator` before the
+    state machine is reset by `StateMachinePool.put()`.
+    """
+
+    def __init__(self, state_machine):
+        self.input_lines = state_machine.input_lines[:]
+        self.input_offset = state_machine.input_offset
+        self.line_offset = state_machine.line_offset
+
+    get_source_and_line = StateMachine.__dict__['get_source_and_line']
+
+
+class StateMachinePool:
+
+    """
+    Idle state machines, kept for reuse.
+
+    Constructing a state machine instantiates all of its states, which
+    build all of their transitions; for short inputs this dominates the
+    running time.  `get()` returns a state machine in its initial
+    condition (a new one, or one given back with `put()`), so that the
+    states and transitions are built only once per concurrently used
+    machine.  State machines are told apart by class, state classes,
+    initial state and debug flag.
+
+    A state machine is reset by restoring the instance attributes of the
+    machine and its states as they were right after construction; lists
+    and dictionaries (like the transitions) changed in place are replaced
+    by copies of their initial contents.  Code keeping references to a
+    state machine or to its states must not `put()` it back.
+    """
+
+    max_idle = 16
+    """Maximum number of idle state machines kept for each key."""
+
+    def __init__(self):
+        self.idle = {}
+        """Mapping of {key: list of idle state machines}."""
+
+    def get(self, state_machine_class, debug=0, **kwargs):
+        """
+        Return a state machine equivalent to
+        ``state_machine_class(debug=debug, **kwargs)``.
+        """
+        key = self.make_key(state_machine_class, debug, kwargs)
+        if key is not None:
+            try:
+                return self.idle[key].pop()
+            except (KeyError, IndexError):
+                pass
+        state_machine = state_machine_class(debug=debug, **kwargs)
+        if key is not None:
+            state_machine.pool_data = (key, self.snapshot(state_machine))
+        return state_machine
+
+    def put(self, state_machine):
+        """
+        Reset `state_machine` and keep it for reuse (if obtained from
+        `get()`, else unlink it).
+        """
+        pool_data = state_machine.__dict__.get('pool_data')
+        if pool_data is None:
+            state_machine.unlink()
+            return
+        key, snapshot = pool_data
+        idle = self.idle.setdefault(key, [])
+        if len(idle) >= self.max_idle:
+            state_machine.unlink()
+            return
+        self.restore(state_machine, snapshot)
+        state_machine.pool_data = pool_data
+        idle.append(state_machine)
+
+    def make_key(self, state_machine_class, debug, kwargs):
+        """Return the pool key for the given arguments, or None."""
+        if len(kwargs) != 2 or 'state_classes' not in kwargs \
+               or 'initial_state' not in kwargs:
+            return None
+        return (state_machine_class, tuple(kwargs['state_classes']),
+                kwargs['initial_state'], debug)
+
+    def snapshot(self, state_machine):
+        """
+        Return the instance attributes of `state_machine` & its states, with
+        copies of the lists and dictionaries among them.
+        """
+        states = [(state, self.snapshot_attributes(state))
+                  for state in state_machine.states.values()]
+        return self.snapshot_attributes(state_machine), states
+
+    def snapshot_attributes(self, obj):
+        """Return (attribute dictionary, {name: copy of list or dict})."""
+        containers = {}
+        for name, value in obj.__dict__.items():
+            if type(value) in (list, dict):
+                containers[name] = copy(value)
+        return obj.__dict__.copy(), containers
+
+    def restore(self, state_machine, snapshot):
+        """Reset the instance attributes of `state_machine` & its states."""
+        machine_attributes, states = snapshot
+        self.restore_attributes(state_machine, machine_attributes)
+        for state, attributes in states:
+            dispatch = state.transition_dispatch
+            if self.restore_attributes(state, attributes):
+                # Transitions unchanged, dispatch table still valid:
+                state.transition_dispatch = dispatch
+
+    def restore_attributes(self, obj, snapshot):
+        """
+        Reset the instance attributes of `obj`.  Return true if no list or
+        dictionary had to be replaced.
+        """
+        attributes, containers = snapshot
+        current = obj.__dict__
+        current.clear()
+        current.update(attributes)
+        unchanged = 1
+        for name, value in containers.items():
+            if current[name] != value:
+                current[name] = copy(value)
+                unchanged = 0
+        return unchanged
+
+
+class Profile:
+
+    """
+    Accumulate call counts and times of state machine activity.
+
+    Assign an instance to `StateMachine.profile` and every transition method
+    called by `StateMachine.check_line()` is timed, keyed by ``("transition",
+    "StateName.transition_name")``.  Applications time their own units of
+    work with `call()` (the reStructuredText parser uses "directive" and
+    "role" keys).  Unlike ``debug`` mode, nothing is output while running;
+    call `report()` when done.
+
+    For every key, three numbers are kept (as in the `profile` module):
+    the number of calls, the internal time (excluding the time of other timed
+    calls made from within), and the cumulative time (including them).
+    """
+
+    if sys.platform == 'win32':
+        timer = staticmethod(time.clock)
+    else:
+        timer = staticmethod(time.time)
+
+    def __init__(self):
+        self.stats = {}
+        """Mapping of {(kind, name): [calls, internal time, cumulative
+        time]}."""
+
+        self.stack = []
+        """Time spent in timed calls nested inside each active call."""
+
+        self.active = {}
+        """Mapping of {(kind, name): number of active calls}, to count
+        recursive calls only once in the cumulative time."""
+
+    def call(self, key, function, *args, **kwargs):
+        """
+        Call `function` with the given arguments, return its return value,
+        and add the time it took to the statistics of `key` (a (kind, name)
+        2-tuple).
+        """
+        self.stack.append(0.0)
+        self.active[key] = self.active.get(key, 0) + 1
+        start = self.timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = self.timer() - start
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            self.active[key] -= 1
+            try:
+                stat = self.stats[key]
+            except KeyError:
+                stat = self.stats[key] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed - nested
+            if not self.active[key]:
+                stat[2] += elapsed
+
+    def sorted_stats(self):
+        """
+        Return a list of (calls, internal time, cumulative time, kind, name)
+        tuples, most expensive (internal time) first.
+        """
+        stats = [(internal, cumulative, calls, kind, name)
+                 for (kind, name), (calls, internal, cumulative)
+                 in self.stats.items()]
+        stats.sort()
+        stats.reverse()
+        return [(calls, internal, cumulative, kind, name)
+                for internal, cumulative, calls, kind, name in stats]
+
+    def report(self, stream=None):
+        """Write the statistics as a table to `stream` (default stderr)."""
+        if stream is None:
+            stream = sys.stderr
+        print >>stream, '%8s %10s %10s  %-10s %s' % (
+            'calls', 'internal', 'cumulative', 'kind', 'name')
+        for calls, internal, cumulative, kind, name in self.sorted_stats():
+            print >>stream, '%8d %10.4f %10.4f  %-10s %s' % (
+                calls, internal, cumulative, kind, name)
+
+
 class ViewList:
 
     """
@@ -1082,58 +1405,175 @@ class ViewList:
     Also, ViewList objects keep track of the source & offset of each item.
     This information is accessible via the `source()`, `offset()`, and
     `info()` methods.
+
+    Slicing doesn't copy the items: a slice refers to a range of the list of
+    items it was taken from, which from then on is shared and never modified
+    in place.  The `data` attribute (a private list of items) is only created
+    when it is accessed or the list is changed.  Sources & offsets are kept
+    as runs of consecutive lines (see `info()`); the `items` attribute
+    returns a new list of (source, offset) pairs.
     """
 
     def __init__(self, initlist=None, source=None, items=None,
                  parent=None, parent_offset=None):
-        self.data = []
-        """The actual list of data, flattened from various sources."""
-
-        self.items = []
-        """A list of (source, offset) pairs, same length as `self.data`: the
-        source of each line and the offset of each line from the beginning of
-        its source."""
-
         self.parent = parent
         """The parent list."""
 
         self.parent_offset = parent_offset
         """Offset of this list from the beginning of the parent list."""
 
+        self.view_lines, self.view_start, self.view_stop = [], 0, 0
+        """A list of items (possibly shared with other ViewLists), and the
+        range of it making up this list.  Not used while there is a `data`
+        attribute."""
+
+        self.run_starts = []
+        """The indices where runs of consecutive lines from one source
+        begin."""
+
+        self.run_items = []
+        """The (source, offset) pair of the first line of each run."""
+
         if isinstance(initlist, ViewList):
-            self.data = initlist.data[:]
-            self.items = initlist.items[:]
+            (self.view_lines, self.view_start,
+             self.view_stop) = initlist.shared_range()
+            self.run_starts, self.run_items = initlist.slice_runs(
+                0, len(initlist))
         elif initlist is not None:
-            self.data = list(initlist)
+            self.view_lines = list(initlist)
+            self.view_stop = len(self.view_lines)
             if items:
-                self.items = items
-            else:
-                self.items = [(source, i) for i in range(len(initlist))]
-        assert len(self.data) == len(self.items), 'data mismatch'
+                assert len(items) == self.view_stop, 'data mismatch'
+                self.set_items(items)
+            elif self.view_lines:
+                self.run_starts, self.run_items = [0], [(source, 0)]
+
+    def __getattr__(self, name):
+        if name == 'data':
+            # The actual list of data, flattened from various sources:
+            self.data = data = self.view_lines[self.view_start:self.view_stop]
+            self.view_lines = None
+            return data
+        elif name == 'items':
+            # A list of (source, offset) pairs, same length as `self.data`:
+            return [self.info(i) for i in range(len(self))]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['data'] = self.as_list()
+        state['view_lines'] = None
+        return state
+
+    def shared_range(self):
+        """
+        Return (items list, start, stop) for sharing with a slice.  The
+        items list must not be modified.
+        """
+        if 'data' in self.__dict__:
+            self.view_lines = self.data
+            self.view_start, self.view_stop = 0, len(self.data)
+            del self.data
+        return self.view_lines, self.view_start, self.view_stop
+
+    def as_list(self):
+        """Return a new list of the items."""
+        if 'data' in self.__dict__:
+            return self.data[:]
+        return self.view_lines[self.view_start:self.view_stop]
+
+    def set_items(self, items):
+        """Set the sources & offsets from a list of (source, offset) pairs."""
+        self.run_starts, self.run_items = [], []
+        self.append_runs(range(len(items)), items)
+
+    def append_runs(self, starts, items, base=0):
+        """
+        Append source runs (`starts` relative to `base`), merging runs of
+        consecutive lines.
+        """
+        run_starts, run_items = self.run_starts, self.run_items
+        for start, item in zip(starts, items):
+            start += base
+            if run_items:
+                source, offset = run_items[-1]
+                if (offset is not None and item[1] is not None
+                    and item[0] == source
+                    and item[1] - offset == start - run_starts[-1]):
+                    continue
+            run_starts.append(start)
+            run_items.append(tuple(item))
+
+    def slice_runs(self, start, stop):
+        """
+        Return the source runs (starts & items lists) of lines `start` to
+        `stop` (non-negative indices), relative to `start`.
+        """
+        run_starts, run_items = self.run_starts, self.run_items
+        if start >= stop or not run_starts:
+            return [], []
+        first = bisect.bisect_right(run_starts, start) - 1
+        last = bisect.bisect_left(run_starts, stop, first + 1)
+        source, offset = run_items[first]
+        if offset is not None:
+            offset += start - run_starts[first]
+        starts = [0] + [run_start - start
+                        for run_start in run_starts[first + 1:last]]
+        items = [(source, offset)] + run_items[first + 1:last]
+        return starts, items
+
+    def splice_runs(self, start, stop, other=None):
+        """
+        Replace the source runs of lines `start` to `stop` (non-negative
+        indices) with those of the ViewList `other`.
+        """
+        run_starts, run_items = self.run_starts, self.run_items
+        tail_starts, tail_items = self.slice_runs(stop, len(self))
+        head = bisect.bisect_left(run_starts, start)
+        self.run_starts, self.run_items = run_starts[:head], run_items[:head]
+        if other is not None:
+            starts, items = other.slice_runs(0, len(other))
+            self.append_runs(starts, items, start)
+            start += len(other)
+        if tail_starts:
+            # Only the first run of the tail may continue the last run:
+            self.append_runs(tail_starts[:1], tail_items[:1], start)
+            self.run_starts.extend([tail_start + start
+                                    for tail_start in tail_starts[1:]])
+            self.run_items.extend(tail_items[1:])
 
     def __str__(self):
-        return str(self.data)
+        return str(self.as_list())
 
     def __repr__(self):
         return '%s(%s, items=%s)' % (self.__class__.__name__,
-                                     self.data, self.items)
+                                     self.as_list(), self.items)
 
-    def __lt__(self, other): return self.data <  self.__cast(other)
-    def __le__(self, other): return self.data <= self.__cast(other)
-    def __eq__(self, other): return self.data == self.__cast(other)
-    def __ne__(self, other): return self.data != self.__cast(other)
-    def __gt__(self, other): return self.data >  self.__cast(other)
-    def __ge__(self, other): return self.data >= self.__cast(other)
-    def __cmp__(self, other): return cmp(self.data, self.__cast(other))
+    def __lt__(self, other): return self.as_list() <  self.__cast(other)
+    def __le__(self, other): return self.as_list() <= self.__cast(other)
+    def __eq__(self, other): return self.as_list() == self.__cast(other)
+    def __ne__(self, other): return self.as_list() != self.__cast(other)
+    def __gt__(self, other): return self.as_list() >  self.__cast(other)
+    def __ge__(self, other): return self.as_list() >= self.__cast(other)
+    def __cmp__(self, other): return cmp(self.as_list(), self.__cast(other))
 
     def __cast(self, other):
         if isinstance(other, ViewList):
-            return other.data
+            return other.as_list()
         else:
             return other
 
-    def __contains__(self, item): return item in self.data
-    def __len__(self): return len(self.data)
+    def __contains__(self, item): return item in self.as_list()
+
+    def __len__(self):
+        if 'data' in self.__dict__:
+            return len(self.data)
+        return self.view_stop - self.view_start
+
+    def __iter__(self):
+        if 'data' in self.__dict__:
+            return iter(self.data)
+        return iter(self.view_lines[self.view_start:self.view_stop])
 
     # The __getitem__()/__setitem__() methods check whether the index
     # is a slice first, since indexing a native list with a slice object
@@ -1142,20 +1582,33 @@ class ViewList:
     def __getitem__(self, i):
         if isinstance(i, types.SliceType):
             assert i.step in (None, 1),  'cannot handle slice with stride'
-            return self.__class__(self.data[i.start:i.stop],
-                                  items=self.items[i.start:i.stop],
-                                  parent=self, parent_offset=i.start or 0)
-        else:
+            start, stop, step = i.indices(len(self))
+            stop = max(start, stop)
+            lines, offset, end = self.shared_range()
+            child = self.__class__(parent=self, parent_offset=i.start or 0)
+            child.view_lines = lines
+            child.view_start, child.view_stop = offset + start, offset + stop
+            child.run_starts, child.run_items = self.slice_runs(start, stop)
+            return child
+        elif 'data' in self.__dict__:
             return self.data[i]
+        else:
+            length = self.view_stop - self.view_start
+            if i < 0:
+                i += length
+            if not 0 <= i < length:
+                raise IndexError('list index out of range')
+            return self.view_lines[self.view_start + i]
 
     def __setitem__(self, i, item):
         if isinstance(i, types.SliceType):
             assert i.step in (None, 1), 'cannot handle slice with stride'
             if not isinstance(item, ViewList):
                 raise TypeError('assigning non-ViewList to ViewList slice')
-            self.data[i.start:i.stop] = item.data
-            self.items[i.start:i.stop] = item.items
-            assert len(self.data) == len(self.items), 'data mismatch'
+            start, stop, step = i.indices(len(self))
+            stop = max(start, stop)
+            self.splice_runs(start, stop, item)
+            self.data[start:stop] = item.as_list()
             if self.parent:
                 self.parent[(i.start or 0) + self.parent_offset
                             : (i.stop or len(self)) + self.parent_offset] = item
@@ -1165,103 +1618,131 @@ class ViewList:
                 self.parent[i + self.parent_offset] = item
 
     def __delitem__(self, i):
-        try:
-            del self.data[i]
-            del self.items[i]
-            if self.parent:
-                del self.parent[i + self.parent_offset]
-        except TypeError:
+        if isinstance(i, types.SliceType):
             assert i.step is None, 'cannot handle slice with stride'
+            start, stop, step = i.indices(len(self))
+            if start < stop:
+                self.splice_runs(start, stop)
             del self.data[i.start:i.stop]
-            del self.items[i.start:i.stop]
             if self.parent:
                 del self.parent[(i.start or 0) + self.parent_offset
                                 : (i.stop or len(self)) + self.parent_offset]
+        else:
+            length = len(self)
+            index = i
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError('list assignment index out of range')
+            self.splice_runs(index, index + 1)
+            del self.data[index]
+            if self.parent:
+                del self.parent[i + self.parent_offset]
 
     def __add__(self, other):
         if isinstance(other, ViewList):
-            return self.__class__(self.data + other.data,
-                                  items=(self.items + other.items))
+            result = self.__class__(self)
+            result.extend(other)
+            return result
         else:
             raise TypeError('adding non-ViewList to a ViewList')
 
     def __radd__(self, other):
         if isinstance(other, ViewList):
-            return self.__class__(other.data + self.data,
-                                  items=(other.items + self.items))
+            result = self.__class__(other)
+            result.extend(self)
+            return result
         else:
             raise TypeError('adding ViewList to a non-ViewList')
 
     def __iadd__(self, other):
         if isinstance(other, ViewList):
-            self.data += other.data
+            self.splice_runs(len(self), len(self), other)
+            self.data += other.as_list()
         else:
             raise TypeError('argument to += must be a ViewList')
         return self
 
     def __mul__(self, n):
-        return self.__class__(self.data * n, items=(self.items * n))
+        result = self.__class__()
+        for i in range(n):
+            result.extend(self)
+        return result
 
     __rmul__ = __mul__
 
     def __imul__(self, n):
-        self.data *= n
-        self.items *= n
+        original = self.__class__(self)
+        del self.data[:]
+        self.run_starts, self.run_items = [], []
+        for i in range(n):
+            self += original
         return self
 
     def extend(self, other):
         if not isinstance(other, ViewList):
             raise TypeError('extending a ViewList with a non-ViewList')
         if self.parent:
-            self.parent.insert(len(self.data) + self.parent_offset, other)
-        self.data.extend(other.data)
-        self.items.extend(other.items)
+            self.parent.insert(len(self) + self.parent_offset, other)
+        self.splice_runs(len(self), len(self), other)
+        self.data.extend(other.as_list())
 
     def append(self, item, source=None, offset=0):
         if source is None:
             self.extend(item)
         else:
             if self.parent:
-                self.parent.insert(len(self.data) + self.parent_offset, item,
+                self.parent.insert(len(self) + self.parent_offset, item,
                                    source, offset)
+            self.append_runs([len(self)], [(source, offset)])
             self.data.append(item)
-            self.items.append((source, offset))
 
     def insert(self, i, item, source=None, offset=0):
         if source is None:
             if not isinstance(item, ViewList):
                 raise TypeError('inserting non-ViewList with no source given')
-            self.data[i:i] = item.data
-            self.items[i:i] = item.items
+            start = slice(i, i).indices(len(self))[0]
+            self.splice_runs(start, start, item)
+            self.data[i:i] = item.as_list()
             if self.parent:
-                index = (len(self.data) + i) % len(self.data)
+                index = (len(self) + i) % len(self)
                 self.parent.insert(index + self.parent_offset, item)
         else:
+            start = slice(i, i).indices(len(self))[0]
+            self.splice_runs(start, start,
+                             ViewList([item], items=[(source, offset)]))
             self.data.insert(i, item)
-            self.items.insert(i, (source, offset))
             if self.parent:
-                index = (len(self.data) + i) % len(self.data)
+                index = (len(self) + i) % len(self)
                 self.parent.insert(index + self.parent_offset, item,
                                    source, offset)
 
     def pop(self, i=-1):
         if self.parent:
-            index = (len(self.data) + i) % len(self.data)
+            index = (len(self) + i) % len(self)
             self.parent.pop(index + self.parent_offset)
-        self.items.pop(i)
+        index = i
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pop index out of range')
+        self.splice_runs(index, index + 1)
         return self.data.pop(i)
 
     def trim_start(self, n=1):
         """
         Remove items from the start of the list, without touching the parent.
         """
-        if n > len(self.data):
+        if n > len(self):
             raise IndexError("Size of trim too large; can't trim %s items "
-                             "from a list of size %s." % (n, len(self.data)))
+                             "from a list of size %s." % (n, len(self)))
         elif n < 0:
             raise IndexError('Trim size must be >= 0.')
-        del self.data[:n]
-        del self.items[:n]
+        self.run_starts, self.run_items = self.slice_runs(n, len(self))
+        if 'data' in self.__dict__:
+            del self.data[:n]
+        else:
+            self.view_start += n
         if self.parent:
             self.parent_offset += n
 
@@ -1269,42 +1750,59 @@ class ViewList:
         """
         Remove items from the end of the list, without touching the parent.
         """
-        if n > len(self.data):
+        if n > len(self):
             raise IndexError("Size of trim too large; can't trim %s items "
-                             "from a list of size %s." % (n, len(self.data)))
+                             "from a list of size %s." % (n, len(self)))
         elif n < 0:
             raise IndexError('Trim size must be >= 0.')
-        del self.data[-n:]
-        del self.items[-n:]
+        # Like ``del self.data[-n:]`` (which also empties the list if n is 0):
+        keep = slice(None, -n).indices(len(self))[1]
+        self.run_starts, self.run_items = self.slice_runs(0, keep)
+        if 'data' in self.__dict__:
+            del self.data[keep:]
+        else:
+            self.view_stop = self.view_start + keep
 
     def remove(self, item):
         index = self.index(item)
         del self[index]
 
-    def count(self, item): return self.data.count(item)
-    def index(self, item): return self.data.index(item)
+    def count(self, item): return self.as_list().count(item)
+    def index(self, item): return self.as_list().index(item)
 
     def reverse(self):
+        items = self.items
+        items.reverse()
+        self.set_items(items)
         self.data.reverse()
-        self.items.reverse()
         self.parent = None
 
     def sort(self, *args):
-        tmp = zip(self.data, self.items)
+        tmp = zip(self.as_list(), self.items)
         tmp.sort(*args)
         self.data = [entry[0] for entry in tmp]
-        self.items = [entry[1] for entry in tmp]
+        self.set_items([entry[1] for entry in tmp])
         self.parent = None
 
     def info(self, i):
         """Return source & offset for index `i`."""
-        try:
-            return self.items[i]
-        except IndexError:
-            if i == len(self.data):     # Just past the end
-                return self.items[i - 1][0], None
-            else:
-                raise
+        length = len(self)
+        index = i
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            if i == length and length:  # Just past the end
+                return self.info(i - 1)[0], None
+            raise IndexError('list index out of range')
+        run_starts = self.run_starts
+        if len(run_starts) == 1:
+            k = 0
+        else:
+            k = bisect.bisect_right(run_starts, index) - 1
+        source, offset = self.run_items[k]
+        if offset is None:
+            return source, offset
+        return source, offset + index - run_starts[k]
 
     def source(self, i):
         """Return source for index `i`."""
@@ -1320,7 +1818,7 @@ class ViewList:
 
     def xitems(self):
         """Return iterator yielding (source, offset, value) tuples."""
-        for (value, (source, offset)) in zip(self.data, self.items):
+        for (value, (source, offset)) in zip(self.as_list(), self.items):
             yield (source, offset, value)
 
     def pprint(self):
@@ -1350,18 +1848,18 @@ class StringList(ViewList):
         indented line is encountered before the text block ends (with a blank
         line).
         """
-        end = start
-        last = len(self.data)
+        lines, offset, last = self.shared_range()
+        end = offset + start
         while end < last:
-            line = self.data[end]
+            line = lines[end]
             if not line.strip():
                 break
             if flush_left and (line[0] == ' '):
-                source, offset = self.info(end)
-                raise UnexpectedIndentationError(self[start:end], source,
-                                                 offset + 1)
+                source, lineno = self.info(end - offset)
+                raise UnexpectedIndentationError(
+                    self[start:end - offset], source, lineno + 1)
             end += 1
-        return self[start:end]
+        return self[start:end - offset]
 
     def get_indented(self, start=0, until_blank=0, strip_indent=1,
                      block_indent=None, first_indent=None):
@@ -1386,21 +1884,21 @@ class StringList(ViewList):
           - a boolean: did the indented block finish with a blank line or EOF?
         """
         indent = block_indent           # start with None if unknown
-        end = start
+        lines, offset, last = self.shared_range()
+        end = offset + start
         if block_indent is not None and first_indent is None:
             first_indent = block_indent
         if first_indent is not None:
             end += 1
-        last = len(self.data)
         while end < last:
-            line = self.data[end]
+            line = lines[end]
             if line and (line[0] != ' '
                          or (block_indent is not None
                              and line[:block_indent].strip())):
                 # Line not indented or insufficiently indented.
                 # Block finished properly iff the last indented line blank:
-                blank_finish = ((end > start)
-                                and not self.data[end - 1].strip())
+                blank_finish = ((end > offset + start)
+                                and not lines[end - 1].strip())
                 break
             stripped = line.lstrip()
             if not stripped:            # blank line
@@ -1416,7 +1914,7 @@ class StringList(ViewList):
             end += 1
         else:
             blank_finish = 1            # block ends at end of lines
-        block = self[start:end]
+        block = self[start:end - offset]
         if first_indent is not None and block:
             block.data[0] = block.data[0][first_indent:]
         if indent and strip_indent:
@@ -1426,12 +1924,13 @@ class StringList(ViewList):
     def get_2D_block(self, top, left, bottom, right, strip_indent=1):
         block = self[top:bottom]
         indent = right
-        for i in range(len(block.data)):
-            block.data[i] = line = block.data[i][left:right].rstrip()
+        data = [line[left:right].rstrip() for line in block]
+        for line in data:
             if line:
                 indent = min(indent, len(line) - len(line.lstrip()))
         if strip_indent and 0 < indent < right:
-            block.data = [line[indent:] for line in block.data]
+            data = [line[indent:] for line in data]
+        block.data = data
         return block
 
     def pad_double_width(self, pad_char):
@@ -1489,7 +1988,7 @@ class StateCorrection(Exception):
 
 
 def string2lines(astring, tab_width=8, convert_whitespace=0,
-                 whitespace=re.compile('[\v\f]')):
+                 whitespace=None):
     """
     Return a list of one-line strings with tabs expanded, no newlines, and
     trailing whitespace stripped.
@@ -1502,10 +2001,97 @@ def string2lines(astring, tab_width=8, convert_whitespace=0,
     - `astring`: a multi-line string.
     - `tab_width`: the number of columns between tab stops.
     - `convert_whitespace`: convert form feeds and vertical tabs to spaces?
+    - `whitespace`: a compiled regular expression matching the characters
+      to convert instead (default: form feeds and vertical tabs).
+
+    Whitespace conversion and tab expansion work on the whole string, and
+    are skipped for input which doesn't need them.
     """
     if convert_whitespace:
-        astring = whitespace.sub(' ', astring)
-    return [s.expandtabs(tab_width).rstrip() for s in astring.splitlines()]
+        if whitespace is None:
+            astring = astring.replace('\v', ' ').replace('\f', ' ')
+        else:
+            astring = whitespace.sub(' ', astring)
+    if '\t' in astring:
+        return [s.expandtabs(tab_width).rstrip()
+                for s in astring.splitlines()]
+    return [s.rstrip() for s in astring.splitlines()]
+
+_transition_table_cache = {}
+"""Shared transition data for `State.make_transitions()`, mapping {(state
+class, transition names): (patterns mapping, names, [(name, compiled
+pattern, next state name), ...])}."""
+
+_transition_dispatch_cache = {}
+"""Transition dispatch tables, by transition names & patterns."""
+
+_first_characters_cache = {}
+
+def _first_characters(pattern):
+    """
+    Return a dictionary whose keys are the characters a match of the
+    compiled regular expression `pattern` may begin with, or None if the
+    pattern may match an empty string or the set cannot be determined.
+
+    The result may contain characters that cannot begin a match (e.g.
+    lookahead assertions are ignored), but never lacks one that can.
+    """
+    key = (pattern.pattern, pattern.flags)
+    if key not in _first_characters_cache:
+        chars = None
+        if not pattern.flags & re.IGNORECASE:
+            try:
+                chars, nullable = _first_characters_of_sequence(
+                    sre_parse.parse(pattern.pattern, pattern.flags))
+                if nullable:
+                    chars = None
+            except (_Undetermined, sre_constants.error):
+                chars = None
+        _first_characters_cache[key] = chars
+    return _first_characters_cache[key]
+
+class _Undetermined(Exception): pass
+
+def _first_characters_of_sequence(sequence):
+    """
+    Return a dictionary of first characters of the parsed regular expression
+    `sequence` and a boolean: may it match an empty string?
+    """
+    chars = {}
+    for op, av in sequence:
+        nullable = 0
+        if op is sre_constants.LITERAL:
+            chars[unichr(av)] = 1
+        elif op is sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    chars[unichr(item_av)] = 1
+                elif (item_op is sre_constants.RANGE
+                      and item_av[1] - item_av[0] < 256):
+                    for code in range(item_av[0], item_av[1] + 1):
+                        chars[unichr(code)] = 1
+                else:                   # negation, category, large range
+                    raise _Undetermined
+        elif op is sre_constants.SUBPATTERN:
+            subchars, nullable = _first_characters_of_sequence(av[-1])
+            chars.update(subchars)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            subchars, nullable = _first_characters_of_sequence(av[2])
+            chars.update(subchars)
+            nullable = nullable or av[0] == 0
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                subchars, subnullable = _first_characters_of_sequence(branch)
+                chars.update(subchars)
+                nullable = nullable or subnullable
+        elif op in (sre_constants.AT, sre_constants.ASSERT,
+                    sre_constants.ASSERT_NOT):
+            nullable = 1                # zero-width; ignore the constraint
+        else:                           # any character, backreference, ...
+            raise _Undetermined
+        if not nullable:
+            return chars, 0
+    return chars, 1
 
 def _exception_data():
     """
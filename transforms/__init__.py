@@ -24,9 +24,21 @@ choose to perform on the parsed document.
 __docformat__ = 'reStructuredText'
 
 
+import sys
+import time
+try:
+    import resource
+except ImportError:                     # not available on Windows
+    resource = None
 from docutils import languages, ApplicationError, TransformSpec
 
 
+if sys.platform == 'win32':
+    timer = time.clock
+else:
+    timer = time.time
+
+
 class TransformError(ApplicationError): pass
 
 
@@ -39,6 +51,17 @@ class Transform:
     default_priority = None
     """Numerical priority of this transform, 0 through 999 (override)."""
 
+    node_classes = None
+    """Tuple of the node classes this transform visits, or None (override).
+
+    A transform that only needs to look at the nodes of some classes, one
+    at a time, can set `node_classes` and override `visit_node()` instead
+    of `apply()`.  The `Transformer` then may apply it together with other
+    such transforms of adjacent priority in a single walk of the document
+    tree (see `Transformer.apply_fused()`).  Transforms overriding
+    `apply()` are never fused (their `apply()` is always called), even if
+    they inherit `node_classes`."""
+
     def __init__(self, document, startnode=None):
         """
         Initial setup for in-place document transforms.
@@ -57,7 +80,36 @@ class Transform:
         """Language module local to this document."""
 
     def apply(self, **kwargs):
-        """Override to apply the transform to the document tree."""
+        """
+        Override to apply the transform to the document tree.
+
+        The default implementation calls `self.visit_node()` for each node
+        of the classes returned by `self.get_node_classes()`.
+        """
+        node_classes = self.get_node_classes()
+        if node_classes is None:
+            raise NotImplementedError('subclass must override this method')
+        if len(node_classes) == 1:
+            # A single class may be answered from the document's node index.
+            node_classes = node_classes[0]
+        elif not node_classes:
+            return
+        for node in self.document.traverse(node_classes):
+            self.visit_node(node)
+
+    def get_node_classes(self):
+        """
+        Return the tuple of node classes to visit (`self.node_classes` by
+        default).  Override to return an empty tuple if the transform has
+        nothing to do (e.g. because it is disabled by a setting).
+        """
+        return self.node_classes
+
+    def visit_node(self, node):
+        """
+        Override to transform a single `node`, an instance of one of the
+        classes returned by `self.get_node_classes()`.
+        """
         raise NotImplementedError('subclass must override this method')
 
 
@@ -93,6 +145,13 @@ class Transformer(TransformSpec):
         """Internal serial number to keep track of the add order of
         transforms."""
 
+        self.statistics = None
+        """List of ``(priority string, transform class, pending node or
+        None, seconds, node count before, node count after, memory delta in
+        bytes or None)`` tuples, one per applied transform, in order.
+        Only recorded if the "profile_transforms" setting is true; see
+        `self.report_statistics()`."""
+
     def add_transform(self, transform_class, priority=None, **kwargs):
         """
         Store a single transform.  Use `priority` to override the default.
@@ -160,6 +219,11 @@ class Transformer(TransformSpec):
         """Apply all of the stored transforms, in priority order."""
         self.document.reporter.attach_observer(
             self.document.note_transform_message)
+        if getattr(self.document.settings, 'node_index', None):
+            self.document.enable_node_index()
+        profile = getattr(self.document.settings, 'profile_transforms', None)
+        if profile and self.statistics is None:
+            self.statistics = []
         while self.transforms:
             if not self.sorted:
                 # Unsorted initially, and whenever a transform is added.
@@ -168,5 +232,158 @@ class Transformer(TransformSpec):
                 self.sorted = 1
             priority, transform_class, pending, kwargs = self.transforms.pop()
             transform = transform_class(self.document, startnode=pending)
-            transform.apply(**kwargs)
+            if not profile and fusible(transform_class, pending, kwargs):
+                group = self.pop_fusible(
+                    (priority, transform_class, pending, kwargs), transform)
+                if len(group) > 1:
+                    self.apply_fused(group)
+                    for entry, transform in group:
+                        self.applied.append(entry)
+                    continue
+            if profile:
+                nodes_before = len(self.document.traverse())
+                memory_before = memory_usage()
+                start = timer()
+                transform.apply(**kwargs)
+                seconds = timer() - start
+                memory_delta = memory_usage()
+                if memory_delta is not None:
+                    memory_delta -= memory_before
+                self.statistics.append(
+                    (priority, transform_class, pending, seconds,
+                     nodes_before, len(self.document.traverse()),
+                     memory_delta))
+            else:
+                transform.apply(**kwargs)
             self.applied.append((priority, transform_class, pending, kwargs))
+
+    def pop_fusible(self, entry, transform):
+        """
+        Return a list of ``(queue entry, transform instance)`` pairs:
+        `entry` (just popped from the queue) and its `transform`, followed by the transforms
+        directly behind it in the queue which may be applied in the same
+        tree walk.  These are removed from the queue.
+
+        Only transforms with `node_classes` and the default `apply()`,
+        without pending node and without keyword arguments are fused (see
+        `fusible()`), and only as long as no two of them may visit the same
+        node.  The priority order is kept: the
+        first transform in the queue that cannot join the group ends it.
+        """
+        classes = transform.get_node_classes()
+        group = [(entry, transform)]
+        while self.transforms:
+            priority, transform_class, pending, kwargs = self.transforms[-1]
+            if not fusible(transform_class, pending, kwargs):
+                break
+            transform = transform_class(self.document)
+            node_classes = transform.get_node_classes()
+            if node_classes and classes and overlapping(classes,
+                                                        node_classes):
+                break
+            self.transforms.pop()
+            group.append(((priority, transform_class, pending, kwargs),
+                          transform))
+            classes = classes + node_classes
+        return group
+
+    def apply_fused(self, group):
+        """
+        Apply the transforms of `group` (see `pop_fusible()`) in a single
+        walk of the document tree: each node of interest is passed to the
+        `visit_node()` method of the one transform visiting its class.
+
+        The nodes are collected before any transform is applied, so the
+        transforms should not add nodes of, or remove nodes containing
+        nodes of, classes visited by other transforms of the group.
+        """
+        classes = ()
+        for entry, transform in group:
+            classes += transform.get_node_classes()
+        if not classes:
+            return
+        visitors = {}
+        for node in self.document.traverse(classes):
+            node_class = node.__class__
+            try:
+                visit = visitors[node_class]
+            except KeyError:
+                for entry, transform in group:
+                    if isinstance(node, transform.get_node_classes()):
+                        visit = visitors[node_class] = transform.visit_node
+                        break
+            visit(node)
+
+    def report_statistics(self, stream=None):
+        """
+        Write `self.statistics` as a table to `stream` (default stderr),
+        slowest transform first.
+        """
+        if stream is None:
+            stream = sys.stderr
+        statistics = [(seconds, priority, transform_class, pending,
+                       before, after, memory)
+                      for (priority, transform_class, pending, seconds,
+                           before, after, memory) in self.statistics or ()]
+        statistics.sort()
+        statistics.reverse()
+        print >>stream, '%9s %-7s %7s %7s %9s  %s' % (
+            'seconds', 'prio', 'nodes', 'delta', 'memory', 'transform')
+        total = 0.0
+        for (seconds, priority, transform_class, pending,
+             before, after, memory) in statistics:
+            total += seconds
+            if memory is None:
+                memory = '-'
+            else:
+                memory = '%+dK' % (memory // 1024)
+            name = '%s.%s' % (transform_class.__module__,
+                              transform_class.__name__)
+            if pending is not None:
+                name += ' (pending)'
+            print >>stream, '%9.4f %-7s %7d %+7d %9s  %s' % (
+                seconds, priority[:3], before, after - before, memory, name)
+        print >>stream, '%9.4f total' % total
+
+
+def fusible(transform_class, pending=None, kwargs=None):
+    """
+    Return true if `transform_class` may be applied in a fused tree walk:
+    it sets `Transform.node_classes` and doesn't override `Transform.apply()`
+    (and there is no `pending` node and there are no `kwargs`).
+    """
+    return (transform_class.node_classes is not None
+            and transform_class.apply.im_func is Transform.apply.im_func
+            and pending is None and not kwargs)
+
+
+def overlapping(classes1, classes2):
+    """
+    Return true if there may be nodes which are instances of both a class
+    in the tuple `classes1` and a class in the tuple `classes2`.
+    """
+    stack = list(classes1)
+    while stack:
+        node_class = stack.pop()
+        if issubclass(node_class, classes2):
+            return 1
+        stack.extend(node_class.__subclasses__())
+    return 0
+
+
+def memory_usage():
+    """
+    Return the resident memory size of the process in bytes, or None if
+    unknown (only implemented where ``/proc/self/statm`` exists).
+    """
+    try:
+        statm = open('/proc/self/statm')
+        try:
+            resident = int(statm.read().split()[1])
+        finally:
+            statm.close()
+    except (IOError, IndexError, ValueError):
+        return None
+    if resource is None:
+        return None
+    return resident * resource.getpagesize()
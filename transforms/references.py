@@ -663,6 +663,7 @@ class Substitutions(Transform):
         normed = self.document.substitution_names
         subreflist = self.document.traverse(nodes.substitution_reference)
         nested = {}
+        next_index = {}
         for ref in subreflist:
             refname = ref['refname']
             key = None
@@ -685,19 +686,17 @@ class Substitutions(Transform):
             else:
                 subdef = defs[key]
                 parent = ref.parent
-                index = parent.index(ref)
+                index = self.child_index(parent, ref, next_index)
                 if  ('ltrim' in subdef.attributes
                      or 'trim' in subdef.attributes):
                     if index > 0 and isinstance(parent[index - 1],
                                                 nodes.Text):
-                        parent.replace(parent[index - 1],
-                                       parent[index - 1].rstrip())
+                        parent[index - 1] = parent[index - 1].rstrip()
                 if  ('rtrim' in subdef.attributes
                      or 'trim' in subdef.attributes):
                     if  (len(parent) > index + 1
                          and isinstance(parent[index + 1], nodes.Text)):
-                        parent.replace(parent[index + 1],
-                                       parent[index + 1].lstrip())
+                        parent[index + 1] = parent[index + 1].lstrip()
                 subdef_copy = subdef.deepcopy()
                 try:
                     # Take care of nested substitution references:
@@ -729,7 +728,17 @@ class Substitutions(Transform):
                         msg.add_backref(prbid)
                         ref.replace_self(prb)
                 else:
-                    ref.replace_self(subdef_copy.children)
+                    # Same as ``ref.replace_self(subdef_copy.children)``,
+                    # without looking up `ref` in `parent` again:
+                    new = subdef_copy.children
+                    if new and isinstance(new[0], nodes.Element):
+                        new[0].update_basic_atts(ref)
+                    else:
+                        for att in ('ids', 'names', 'classes', 'dupnames'):
+                            assert not ref[att], \
+                                   'Losing "%s" attribute: %s' % (att, ref[att])
+                    parent[index:index+1] = new
+                    next_index[id(parent)] = index + len(new)
                     # register refname of the replacment node(s)
                     # (needed for resolution of references)
                     for node in subdef_copy.children:
@@ -739,6 +748,21 @@ class Substitutions(Transform):
                             if 'refname' in node:
                                 self.document.note_refname(node)
 
+    def child_index(self, parent, child, next_index):
+        """
+        Return the index of `child` in `parent`.
+
+        References are replaced in document order, so the search starts
+        after the last replacement in `parent` (`next_index` maps
+        ``id(parent)`` to that position).  This avoids searching long
+        paragraphs from the start for each of their references.
+        """
+        children = parent.children
+        for index in xrange(next_index.get(id(parent), 0), len(children)):
+            if children[index] is child:
+                return index
+        return parent.index(child)
+
 
 class TargetNotes(Transform):
 
@@ -87,16 +87,21 @@ class ExposeInternals(Transform):
 
     default_priority = 840
 
+    node_classes = (nodes.Element,)
+
     def not_Text(self, node):
         return not isinstance(node, nodes.Text)
 
-    def apply(self):
+    def get_node_classes(self):
         if self.document.settings.expose_internals:
-            for node in self.document.traverse(self.not_Text):
-                for att in self.document.settings.expose_internals:
-                    value = getattr(node, att, None)
-                    if value is not None:
-                        node['internal:' + att] = value
+            return self.node_classes
+        return ()
+
+    def visit_node(self, node):
+        for att in self.document.settings.expose_internals:
+            value = getattr(node, att, None)
+            if value is not None:
+                node['internal:' + att] = value
 
 
 class Messages(Transform):
@@ -132,10 +137,11 @@ class FilterMessages(Transform):
 
     default_priority = 870
 
-    def apply(self):
-        for node in self.document.traverse(nodes.system_message):
-            if node['level'] < self.document.reporter.report_level:
-                node.parent.remove(node)
+    node_classes = (nodes.system_message,)
+
+    def visit_node(self, node):
+        if node['level'] < self.document.reporter.report_level:
+            node.parent.remove(node)
 
 
 class TestMessages(Transform):
@@ -163,10 +169,15 @@ class StripComments(Transform):
 
     default_priority = 740
 
-    def apply(self):
+    node_classes = (nodes.comment,)
+
+    def get_node_classes(self):
         if self.document.settings.strip_comments:
-            for node in self.document.traverse(nodes.comment):
-                node.parent.remove(node)
+            return self.node_classes
+        return ()
+
+    def visit_node(self, node):
+        node.parent.remove(node)
 
 
 class StripClassesAndElements(Transform):
@@ -72,17 +72,16 @@ class Admonitions(Transform):
 
     default_priority = 920
 
-    def apply(self):
-        language = languages.get_language(self.document.settings.language_code,
-                                          self.document.reporter)
-        for node in self.document.traverse(nodes.Admonition):
-            node_name = node.__class__.__name__
-            # Set class, so that we know what node this admonition came from.
-            node['classes'].append(node_name)
-            if not isinstance(node, nodes.admonition):
-                # Specific admonition.  Transform into a generic admonition.
-                admonition = nodes.admonition(node.rawsource, *node.children,
-                                              **node.attributes)
-                title = nodes.title('', language.labels[node_name])
-                admonition.insert(0, title)
-                node.replace_self(admonition)
+    node_classes = (nodes.Admonition,)
+
+    def visit_node(self, node):
+        node_name = node.__class__.__name__
+        # Set class, so that we know what node this admonition came from.
+        node['classes'].append(node_name)
+        if not isinstance(node, nodes.admonition):
+            # Specific admonition.  Transform into a generic admonition.
+            admonition = nodes.admonition(node.rawsource, *node.children,
+                                          **node.attributes)
+            title = nodes.title('', self.language.labels[node_name])
+            admonition.insert(0, title)
+            node.replace_self(admonition)
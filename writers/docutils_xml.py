@@ -9,8 +9,9 @@ Simple internal document tree Writer, writes Docutils XML.
 __docformat__ = 'reStructuredText'
 
 
+import sys
 import docutils
-from docutils import frontend, writers
+from docutils import frontend, writers, nodes, io
 
 
 class Writer(writers.Writer):
@@ -35,7 +36,11 @@ class Writer(writers.Writer):
          ('Omit the DOCTYPE declaration.',
           ['--no-doctype'],
           {'dest': 'doctype_declaration', 'default': 1,
-           'action': 'store_false', 'validator': frontend.validate_boolean}),))
+           'action': 'store_false', 'validator': frontend.validate_boolean}),
+         ('Write the output file while translating, instead of assembling '
+          'the whole output in memory.  For very large documents.',
+          ['--stream-output'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),))
 
     settings_defaults = {'output_encoding_error_handler': 'xmlcharrefreplace'}
 
@@ -53,14 +58,36 @@ class Writer(writers.Writer):
         ' "http://docutils.sourceforge.net/docs/ref/docutils.dtd">\n')
     generator = '<!-- Generated by Docutils %s -->\n'
 
+    stream_flush_count = 4096
+    """Number of output pieces collected before they are written out in
+    the "stream_output" mode."""
+
+    def __init__(self):
+        writers.Writer.__init__(self)
+        self.translator_class = XMLTranslator
+
+    def write(self, document, destination):
+        """
+        Extend `writers.Writer.write`: with the "stream_output" setting and
+        a `io.FileOutput` destination, write the output while translating.
+        """
+        if (getattr(document.settings, 'stream_output', None)
+            and isinstance(destination, io.FileOutput)):
+            self.document = document
+            self.destination = destination
+            self.visitor = self.translator_class(document)
+            destination.write_chunks(self.stream_chunks())
+            self.output = None
+            return None
+        return writers.Writer.write(self, document, destination)
+
     def translate(self):
+        self.visitor = visitor = self.translator_class(self.document)
+        self.document.walkabout(visitor)
+        self.output = self.output_prefix() + ''.join(visitor.output)
+
+    def output_prefix(self):
         settings = self.document.settings
-        indent = newline = ''
-        if settings.newlines:
-            newline = '\n'
-        if settings.indents:
-            newline = '\n'
-            indent = '    '
         output_prefix = []
         if settings.xml_declaration:
             output_prefix.append(
@@ -68,6 +95,108 @@ class Writer(writers.Writer):
         if settings.doctype_declaration:
             output_prefix.append(self.doctype)
         output_prefix.append(self.generator % docutils.__version__)
-        docnode = self.document.asdom().childNodes[0]
-        self.output = (''.join(output_prefix)
-                       + docnode.toprettyxml(indent, newline))
+        return ''.join(output_prefix)
+
+    def stream_chunks(self):
+        yield unicode(self.output_prefix())
+        for chunk in self.walkabout_chunks(self.document):
+            yield chunk
+        yield u''.join(self.visitor.output)
+
+    def walkabout_chunks(self, node):
+        """
+        Like ``node.walkabout(self.visitor)``, but yield the output
+        collected so far between children, once it is long enough.
+        """
+        visitor = self.visitor
+        output = visitor.output
+        visitor.dispatch_visit(node)
+        for child in node.children:
+            if len(child.children) > 1:
+                for chunk in self.walkabout_chunks(child):
+                    yield chunk
+            else:
+                child.walkabout(visitor)
+            if len(output) >= self.stream_flush_count:
+                yield u''.join(output)
+                del output[:]
+        visitor.dispatch_departure(node)
+
+
+class XMLTranslator(nodes.GenericNodeVisitor):
+
+    """
+    Write Docutils XML directly, without building a DOM first.
+
+    The output is the same as from ``document.asdom()`` and the
+    ``toprettyxml()`` method of `xml.dom.minidom` nodes (including its
+    indentation and escaping rules), in `output`, a list of strings.
+    """
+
+    indent_text_only_elements = ((2, 7, 3) <= sys.version_info < (3, 0)
+                                 or sys.version_info >= (3, 2, 3))
+    """Are elements containing just text written on a single line with
+    indentation (``toprettyxml()`` from Python 2.7.3 and 3.2.3 on)?"""
+
+    def __init__(self, document):
+        nodes.NodeVisitor.__init__(self, document)
+        settings = document.settings
+        self.indent = self.newline = ''
+        if settings.newlines:
+            self.newline = '\n'
+        if settings.indents:
+            self.newline = '\n'
+            self.indent = '    '
+        self.level = 0
+        """Current indentation level."""
+
+        self.in_text_only_element = 0
+        """Inside an element written on a single line?"""
+
+        self.output = []
+
+    def escape(self, data):
+        """Escape special characters like ``xml.dom.minidom`` does."""
+        return data.replace('&', '&amp;').replace('<', '&lt;').replace(
+            '"', '&quot;').replace('>', '&gt;')
+
+    def is_text_only(self, node):
+        return (self.indent_text_only_elements and len(node.children) == 1
+                and isinstance(node.children[0], nodes.Text))
+
+    def default_visit(self, node):
+        parts = [self.indent * self.level, '<', node.tagname]
+        for name, value in node.attlist():
+            if isinstance(value, list):
+                value = ' '.join([nodes.serial_escape('%s' % v)
+                                  for v in value])
+            parts.extend([' ', name, '="', self.escape('%s' % value), '"'])
+        if not node.children:
+            parts.extend(['/>', self.newline])
+        elif self.is_text_only(node):
+            parts.append('>')
+            self.in_text_only_element = 1
+        else:
+            parts.extend(['>', self.newline])
+            self.level += 1
+        self.output.append(''.join(parts))
+
+    def default_departure(self, node):
+        if not node.children:
+            return
+        if self.in_text_only_element:
+            self.in_text_only_element = 0
+        else:
+            self.level -= 1
+            self.output.append(self.indent * self.level)
+        self.output.append('</%s>%s' % (node.tagname, self.newline))
+
+    def visit_Text(self, node):
+        if self.in_text_only_element:
+            self.output.append(self.escape(node))
+        else:
+            self.output.append(self.escape('%s%s%s' % (
+                self.indent * self.level, node, self.newline)))
+
+    def depart_Text(self, node):
+        pass
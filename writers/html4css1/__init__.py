@@ -19,6 +19,8 @@ import os
 import os.path
 import time
 import re
+import codecs
+import tempfile
 try:
     import Image                        # check for the Python Imaging Library
 except ImportError:
@@ -133,6 +135,11 @@ class Writer(writers.Writer):
          ('Obfuscate email addresses to confuse harvesters while still '
           'keeping email links usable with standards-compliant browsers.',
           ['--cloak-email-addresses'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
+         ('Write the document body to the output file section by section, '
+          'instead of assembling the whole output in memory.  For very '
+          'large documents.  Document parts are not available.',
+          ['--stream-output'],
           {'action': 'store_true', 'validator': frontend.validate_boolean}),))
 
     settings_defaults = {'output_encoding_error_handler': 'xmlcharrefreplace'}
@@ -156,6 +163,31 @@ class Writer(writers.Writer):
         writers.Writer.__init__(self)
         self.translator_class = HTMLTranslator
 
+    supports_streaming = 1
+    """May the "stream_output" setting be used?  False for subclasses
+    computing the "body" template substitution differently."""
+
+    stream_block_size = 1 << 16
+    """Number of characters copied at once from the streaming spool."""
+
+    def write(self, document, destination):
+        """
+        Extend `writers.Writer.write`: with the "stream_output" setting and
+        a `io.FileOutput` destination, write the output while translating.
+        """
+        if (getattr(document.settings, 'stream_output', None)
+            and self.supports_streaming
+            and isinstance(destination, io.FileOutput)):
+            self.document = document
+            self.language = languages.get_language(
+                document.settings.language_code, document.reporter)
+            self.destination = destination
+            template = self.read_template()
+            if template.count('%(body)s') == 1:
+                self.translate_streaming(template)
+                return None
+        return writers.Writer.write(self, document, destination)
+
     def translate(self):
         self.visitor = visitor = self.translator_class(self.document)
         self.document.walkabout(visitor)
@@ -163,10 +195,114 @@ class Writer(writers.Writer):
             setattr(self, attr, getattr(visitor, attr))
         self.output = self.apply_template()
 
-    def apply_template(self):
+    def translate_streaming(self, template):
+        """
+        Translate `self.document` and write the output to
+        `self.destination` without holding the complete body in memory.
+
+        Finished parts of the body are encoded and spooled to a temporary
+        file between the sections and top-level body elements.  Parts that
+        precede the body in the output (head, stylesheet, docinfo) may
+        still change until the end of the document (meta tags, MathML);
+        they are assembled as usual and written first, followed by the
+        spooled body and the rest of the template.
+        """
+        self.visitor = visitor = self.translator_class(self.document)
+        spool = tempfile.TemporaryFile()
+        try:
+            self.spool = codecs.getwriter('utf-8')(spool)
+            self.spool_newlines = ''
+            # The translator discards the body preceding the docinfo:
+            self.docinfo_pending = (self.document.first_child_matching_class(
+                nodes.docinfo) is not None)
+            self.walkabout_streaming(self.document, visitor)
+            for attr in self.visitor_attributes:
+                setattr(self, attr, getattr(visitor, attr))
+            # "body" is substituted with its trailing newlines stripped:
+            self.spool.write(
+                (self.spool_newlines + ''.join(self.body)).rstrip('\n'))
+            self.body = []
+            subs = self.interpolation_dict()
+            template_prefix, template_suffix = template.split('%(body)s')
+            spool.seek(0)
+            self.destination.write_chunks(self.stream_chunks(
+                template_prefix % subs, codecs.getreader('utf-8')(spool),
+                template_suffix % subs))
+        finally:
+            self.spool = None
+            spool.close()
+        self.output = None
+
+    def stream_chunks(self, prefix, spool, suffix):
+        yield prefix
+        while 1:
+            block = spool.read(self.stream_block_size)
+            if not block:
+                break
+            yield block
+        yield suffix
+
+    def walkabout_streaming(self, node, visitor):
+        """
+        Like ``node.walkabout(visitor)``, but spool the finished body after
+        each child of the document and of sections.
+        """
+        call_depart = 1
+        stop = 0
+        try:
+            try:
+                visitor.dispatch_visit(node)
+            except nodes.SkipNode:
+                return stop
+            except nodes.SkipDeparture:
+                call_depart = 0
+            try:
+                for child in node.children[:]:
+                    if isinstance(child, nodes.section):
+                        stop = self.walkabout_streaming(child, visitor)
+                    else:
+                        stop = child.walkabout(visitor)
+                    if stop:
+                        break
+                    self.spool_body(visitor)
+            except nodes.SkipSiblings:
+                pass
+        except nodes.SkipChildren:
+            pass
+        except nodes.StopTraversal:
+            stop = 1
+        if call_depart:
+            visitor.dispatch_departure(node)
+        return stop
+
+    def spool_body(self, visitor):
+        """Write out `visitor.body`, unless it may still be modified."""
+        if visitor.in_document_title:
+            return
+        for item in visitor.context:
+            if isinstance(item, int):   # start index of pending body part
+                return
+        if self.docinfo_pending:
+            if not visitor.docinfo:
+                return
+            self.docinfo_pending = 0
+        text = ''.join(visitor.body)
+        del visitor.body[:]
+        stripped = text.rstrip('\n')
+        if stripped:
+            self.spool.write(self.spool_newlines + stripped)
+            self.spool_newlines = text[len(stripped):]
+        else:
+            self.spool_newlines += text
+
+    def read_template(self):
         template_file = open(self.document.settings.template, 'rb')
         template = unicode(template_file.read(), 'utf-8')
         template_file.close()
+        return template
+
+    def apply_template(self):
+        template = self.read_template()
         subs = self.interpolation_dict()
         return template % subs
 
@@ -32,6 +32,9 @@ class Writer(html4css1.Writer):
         os.path.join(os.getcwd(), 'dummy'),
         os.path.join(os.path.dirname(__file__), default_template))
 
+    supports_streaming = 0
+    """The "body" substitution includes the docinfo (PEP header)."""
+
     settings_spec = html4css1.Writer.settings_spec + (
         'PEP/HTML-Specific Options',
         'For the PEP/HTML writer, the default value for the --stylesheet-path '